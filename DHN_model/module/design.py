@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+from .friction import lamb_func
+from .network import CompiledNetwork
+from .simulation import (hydraulics_known_flows_tree,
+                         hydraulics_known_flows_wo_loops_batch,
+                         pipe_properties, pressure_drop)
+
+
+def design_flows(G, m_node):
+    r"""
+    Design mass flow of every pipe in a tree network.
+
+    Parameters
+    ----------
+    G : networkx MultiDiGraph or CompiledNetwork
+        Tree network.
+    m_node : np.array
+        Mass flow leaving the network at every node, or nodes x timesteps.
+
+    Returns
+    -------
+    flows : np.array
+        Largest absolute mass flow of every edge over all timesteps
+        [kg/s], ordered like G.edges.
+    """
+    m_node = np.asarray(m_node, dtype=float)
+    if m_node.ndim == 1:
+        return np.abs(hydraulics_known_flows_tree(G, m_node))
+    return np.abs(hydraulics_known_flows_wo_loops_batch(G, m_node)).max(axis=1)
+
+
+def size_pipes(G, m_node, catalog, v_max=2., dp_max=200., rho=951,
+               mu=0.255e-3, friction_factor=lamb_func, critical=0.9):
+    r"""
+    Cheapest pipe of a catalog for every pipe of a tree network, so that
+    flow velocity and specific pressure drop stay within limits.
+
+    All catalog sizes are evaluated for all pipes at once, as arrays of
+    pipes x sizes.
+
+    Parameters
+    ----------
+    G : networkx MultiDiGraph or CompiledNetwork
+        Tree network.
+    m_node : np.array
+        Mass flow leaving the network at every node [kg/s], or
+        nodes x timesteps. The largest flow of every pipe is used.
+    catalog : pd.DataFrame
+        Available pipes with columns 'diameter_mm' (inner diameter) and
+        'cost_per_m', optionally 'roughness_mm'. Without roughness, the
+        roughness of the network pipes is kept.
+    v_max : float
+        Maximum flow velocity [m/s]
+    dp_max : float
+        Maximum specific pressure drop [Pa/m]
+    rho : float
+        Density [kg/m3]
+    mu : float
+        Dynamic viscosity [Pa s]
+    friction_factor : function
+        See simulation.pressure_drop.
+    critical : float
+        Pipes whose chosen size uses more than this fraction of one of the
+        limits are marked as critical.
+
+    Returns
+    -------
+    sizing : pd.DataFrame
+        Per pipe, ordered like G.edges: 'mass_flow', 'diameter_mm',
+        'cost', 'velocity', 'dp_per_m', 'utilization' (largest ratio of
+        velocity and pressure drop to their limit), 'feasible' and
+        'critical'. Pipes without a feasible size get the largest size and
+        are critical.
+    """
+    catalog = catalog.sort_values('diameter_mm')
+    L, _, eps = pipe_properties(G)
+    m = design_flows(G, m_node)[:, np.newaxis]
+    D = 1e-3 * catalog['diameter_mm'].to_numpy()[np.newaxis, :]
+    if 'roughness_mm' in catalog.columns:
+        eps = 1e-3 * catalog['roughness_mm'].to_numpy()[np.newaxis, :]
+    else:
+        eps = eps[:, np.newaxis]
+
+    # pipes x sizes
+    v = 4 * m / (rho * np.pi * D**2)
+    dp_per_m, _ = pressure_drop(m, 1., D, eps, rho=rho, mu=mu,
+                                friction_factor=friction_factor)
+    utilization = np.maximum(v / v_max, dp_per_m / dp_max)
+    feasible = utilization <= 1
+    cost = catalog['cost_per_m'].to_numpy()[np.newaxis, :] * L[:, np.newaxis]
+
+    choice = np.argmin(np.where(feasible, cost, np.inf), axis=1)
+    any_feasible = feasible.any(axis=1)
+    choice[~any_feasible] = D.shape[1] - 1
+    pipes = np.arange(len(choice))
+
+    if isinstance(G, CompiledNetwork):
+        index = pd.Index(G.edge_ids, name='pipe_no')
+    else:
+        index = pd.RangeIndex(len(choice), name='edge')
+    sizing = pd.DataFrame({'mass_flow': m[:, 0],
+                           'diameter_mm': catalog['diameter_mm'].to_numpy()[choice],
+                           'cost': cost[pipes, choice],
+                           'velocity': v[pipes, choice],
+                           'dp_per_m': dp_per_m[pipes, choice],
+                           'utilization': utilization[pipes, choice],
+                           'feasible': any_feasible},
+                          index=index)
+    sizing['critical'] = ~sizing['feasible'] | (sizing['utilization'] > critical)
+    return sizing
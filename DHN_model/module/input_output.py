@@ -9,6 +9,7 @@ from shapely.geometry import LineString
 import time
 import geopandas as gpd
 import math
+import shapely
 
 def create_network(edge_list, node_list):
     """
@@ -20,10 +21,16 @@ def create_network(edge_list, node_list):
     edge_attr = ['lenght_m', 'diameter_mm', 'heat_transfer_coefficient_W/mK', 'roughness_mm']
     G = nx.from_pandas_edgelist(edge_list, 'from_node', 'to_node', edge_attr=edge_attr, create_using=G)
 
-    for node in G.nodes:
-        G.add_node(node, lon=node_list.loc[int(node)]['lon'],
-                         lat=node_list.loc[int(node)]['lat'],
-                         node_type=node_list.loc[int(node)]['node_type'])
+    # look up the attributes of all nodes at once
+    nodes = list(G.nodes)
+    node_index = pd.Index(nodes).astype(int)
+    missing = ~node_index.isin(node_list.index)
+    if missing.any():
+        raise ValueError('Nodes {} are missing in the node list.'
+                         .format(list(node_index[missing])))
+
+    node_attr = node_list.loc[node_index, ['lon', 'lat', 'node_type']]
+    G.add_nodes_from(zip(nodes, node_attr.to_dict('records')))
 
     return G
 
@@ -57,46 +64,51 @@ def graph_to_gdfs(G, nodes=True, edges=True, node_geometry=True, fill_edge_geome
 
     if nodes:
 
-        start_time = time.time()
-
-        nodes = {node:data for node, data in G.nodes(data=True)}
-        gdf_nodes = gpd.GeoDataFrame(nodes).T
+        # build the frame column-wise and the points from coordinate arrays
+        gdf_nodes = pd.DataFrame.from_dict(dict(G.nodes(data=True)), orient='index')
         if node_geometry:
-            gdf_nodes['geometry'] = gdf_nodes.apply(lambda row: Point(row['x'], row['y']), axis=1)
-        gdf_nodes.crs = G.graph['crs']
+            geometry = gpd.points_from_xy(gdf_nodes['x'].astype(float),
+                                          gdf_nodes['y'].astype(float))
+            gdf_nodes = gpd.GeoDataFrame(gdf_nodes, geometry=geometry,
+                                         crs=G.graph['crs'])
+        else:
+            gdf_nodes = gpd.GeoDataFrame(gdf_nodes)
+            gdf_nodes.crs = G.graph['crs']
         gdf_nodes.gdf_name = '{}_nodes'.format(G.graph['name'])
 
         to_return.append(gdf_nodes)
         
     if edges:
 
-        start_time = time.time()
-
-        # create a list to hold our edges, then loop through each edge in the
-        # graph
-        edges = []
-        for u, v, data in G.edges(data=True):
-            # for each edge, add key and all attributes in data dict to the
-            # edge_details
-            edge_details = {'u':u, 'v':v}
-            for attr_key in data:
-                edge_details[attr_key] = data[attr_key]
-
-            # if edge doesn't already have a geometry attribute, create one now
-            # if fill_edge_geometry==True
-            if 'geometry' not in data:
-                if fill_edge_geometry:
-                    point_u = Point((G.nodes[u]['x'], G.nodes[u]['y']))
-                    point_v = Point((G.nodes[v]['x'], G.nodes[v]['y']))
-                    edge_details['geometry'] = LineString([point_u, point_v])
-                else:
-                    edge_details['geometry'] = np.nan
-
-            edges.append(edge_details)
-
-        # create a GeoDataFrame from the list of edges and set the CRS
-        gdf_edges = gpd.GeoDataFrame(edges)
-        gdf_edges.crs = G.graph['crs']
+        # collect endpoints and attributes in one pass, then build the
+        # frame column-wise
+        edge_data = list(G.edges(data=True))
+        gdf_edges = pd.DataFrame.from_records([data for u, v, data in edge_data],
+                                              index=pd.RangeIndex(len(edge_data)))
+        gdf_edges.insert(0, 'u', [u for u, v, data in edge_data])
+        gdf_edges.insert(1, 'v', [v for u, v, data in edge_data])
+
+        if 'geometry' in gdf_edges.columns:
+            geometry = np.array(gdf_edges['geometry'], dtype=object)
+        else:
+            geometry = np.full(len(gdf_edges), None, dtype=object)
+        missing = pd.isnull(geometry)
+
+        # if edges don't already have a geometry attribute, create two-point
+        # lines from the node coordinates in bulk if fill_edge_geometry==True
+        if fill_edge_geometry and missing.any():
+            node_index = {node: i for i, node in enumerate(G.nodes)}
+            x = np.array([x for _, x in G.nodes(data='x')], dtype=float)
+            y = np.array([y for _, y in G.nodes(data='y')], dtype=float)
+            iu = gdf_edges['u'][missing].map(node_index).to_numpy()
+            iv = gdf_edges['v'][missing].map(node_index).to_numpy()
+            coords = np.stack([np.column_stack([x[iu], y[iu]]),
+                               np.column_stack([x[iv], y[iv]])], axis=1)
+            geometry[missing] = shapely.linestrings(coords)
+
+        gdf_edges['geometry'] = geometry
+        gdf_edges = gpd.GeoDataFrame(gdf_edges, geometry='geometry',
+                                     crs=G.graph['crs'])
         gdf_edges.gdf_name = '{}_edges'.format(G.graph['name'])
 
         to_return.append(gdf_edges)
@@ -0,0 +1,217 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.csgraph import breadth_first_order
+
+
+class CompiledNetwork:
+    r"""
+    Array based representation of a DHN for simulation.
+
+    All edge attributes are stored as contiguous arrays in SI units and
+    the nodes are addressed by their position. The incidence matrix and
+    the tree order are computed once, on first use.
+
+    Parameters
+    ----------
+    node_ids : array-like
+        Node ids, their position defines the node index.
+    from_idx, to_idx : array-like
+        Positional start and end node of every edge.
+    length : array-like
+        Pipe length [m]
+    diameter : array-like
+        Inner diameter [m]
+    heat_transfer_coefficient : array-like
+        Heat transfer coefficient [W/mK]
+    roughness : array-like
+        Roughness [m]
+    edge_ids : array-like
+        Pipe numbers, default is the edge position.
+    node_type, lon, lat : array-like
+        Optional node attributes.
+    """
+    def __init__(self, node_ids, from_idx, to_idx, length, diameter,
+                 heat_transfer_coefficient, roughness, edge_ids=None,
+                 node_type=None, lon=None, lat=None):
+        self.node_ids = np.asarray(node_ids)
+        self.from_idx = np.ascontiguousarray(from_idx, dtype=np.int64)
+        self.to_idx = np.ascontiguousarray(to_idx, dtype=np.int64)
+        self.length = np.ascontiguousarray(length, dtype=float)
+        self.diameter = np.ascontiguousarray(diameter, dtype=float)
+        self.heat_transfer_coefficient = np.ascontiguousarray(
+            heat_transfer_coefficient, dtype=float)
+        self.roughness = np.ascontiguousarray(roughness, dtype=float)
+        if edge_ids is None:
+            edge_ids = np.arange(len(self.from_idx))
+        self.edge_ids = np.asarray(edge_ids)
+        self.node_type = None if node_type is None else np.asarray(node_type)
+        self.lon = None if lon is None else np.asarray(lon, dtype=float)
+        self.lat = None if lat is None else np.asarray(lat, dtype=float)
+
+        self._incidence = None
+        self._tree = None
+
+    @property
+    def n_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self):
+        return len(self.from_idx)
+
+    @property
+    def incidence(self):
+        r"""
+        Oriented incidence matrix (nodes x edges) in CSR format, -1 at the
+        start and +1 at the end node, like ``nx.incidence_matrix``.
+        """
+        if self._incidence is None:
+            edges = np.arange(self.n_edges)
+            self._incidence = sp.csr_matrix(
+                (np.concatenate([-np.ones(self.n_edges), np.ones(self.n_edges)]),
+                 (np.concatenate([self.from_idx, self.to_idx]),
+                  np.concatenate([edges, edges]))),
+                shape=(self.n_nodes, self.n_edges))
+        return self._incidence
+
+    @property
+    def tree(self):
+        r"""
+        Breadth first order, parent node and parent edge of every node,
+        starting at the first node. Only defined for tree networks, see
+        ``tree_order``.
+        """
+        if self._tree is None:
+            self._tree = tree_order(self.from_idx, self.to_idx, self.n_nodes)
+        return self._tree
+
+    @classmethod
+    def from_graph(cls, G):
+        r"""
+        Compile a network created with ``input_output.create_network``.
+        Nodes and edges keep the order of G.nodes and G.edges.
+        """
+        node_ids = list(G.nodes)
+        node_index = {node: i for i, node in enumerate(node_ids)}
+        edges = list(G.edges(data=True))
+        from_idx = [node_index[u] for u, v, d in edges]
+        to_idx = [node_index[v] for u, v, d in edges]
+        data = np.array([(d['lenght_m'], d['diameter_mm'],
+                          d['heat_transfer_coefficient_W/mK'], d['roughness_mm'])
+                         for u, v, d in edges], dtype=float).reshape(-1, 4)
+        nodes = G.nodes
+        return cls(node_ids, from_idx, to_idx,
+                   length=data[:, 0],
+                   diameter=1e-3 * data[:, 1],
+                   heat_transfer_coefficient=data[:, 2],
+                   roughness=1e-3 * data[:, 3],
+                   node_type=[nodes[n].get('node_type') for n in node_ids],
+                   lon=[nodes[n].get('lon', np.nan) for n in node_ids],
+                   lat=[nodes[n].get('lat', np.nan) for n in node_ids])
+
+
+def compile_network(edge_list, node_list):
+    r"""
+    Create a CompiledNetwork from lists describing edges and nodes.
+
+    Nodes and edges are ordered like G.nodes and G.edges of
+    ``input_output.create_network`` for the same lists, so that results
+    line up with the graph, e.g. in ``plotting.animate_network``: the
+    nodes by their first appearance in the edge list, the edges by the
+    position of their start node and then by the order of the edge list.
+    The pipe numbers are kept in edge_ids.
+
+    Parameters
+    ----------
+    edge_list : pd.DataFrame
+        With columns 'from_node', 'to_node', 'lenght_m', 'diameter_mm',
+        'heat_transfer_coefficient_W/mK' and 'roughness_mm', indexed by
+        pipe number or with a column 'pipe_no'.
+    node_list : pd.DataFrame
+        With columns 'lat', 'lon' and 'node_type', indexed by node id or
+        with a column 'node_id'.
+
+    Returns
+    -------
+    CompiledNetwork
+    """
+    if 'node_id' in node_list.columns:
+        node_list = node_list.set_index('node_id')
+    if 'pipe_no' in edge_list.columns:
+        edge_list = edge_list.set_index('pipe_no')
+
+    endpoints = edge_list[['from_node', 'to_node']].to_numpy()
+    node_ids = pd.unique(endpoints.ravel())
+    from_idx, to_idx = pd.Index(node_ids).get_indexer(endpoints.ravel()) \
+                                         .reshape(-1, 2).T
+
+    # edge order of G.edges, which lists the out edges node by node
+    order = np.argsort(from_idx, kind='stable')
+    edge_list = edge_list.iloc[order]
+    from_idx, to_idx = from_idx[order], to_idx[order]
+
+    missing = ~pd.Index(node_ids).isin(node_list.index)
+    if missing.any():
+        raise ValueError('Nodes {} are missing in the node list.'
+                         .format(list(node_ids[missing])))
+    nodes = node_list.loc[node_ids]
+
+    return CompiledNetwork(node_ids, from_idx, to_idx,
+                           length=edge_list['lenght_m'].to_numpy(),
+                           diameter=1e-3 * edge_list['diameter_mm'].to_numpy(),
+                           heat_transfer_coefficient=edge_list[
+                               'heat_transfer_coefficient_W/mK'].to_numpy(),
+                           roughness=1e-3 * edge_list['roughness_mm'].to_numpy(),
+                           edge_ids=edge_list.index.to_numpy(),
+                           node_type=nodes['node_type'].to_numpy(),
+                           lon=nodes['lon'].to_numpy(),
+                           lat=nodes['lat'].to_numpy())
+
+
+def tree_order(from_idx, to_idx, n_nodes, root=0):
+    r"""
+    Breadth first order of a tree network starting at the root node.
+
+    Parameters
+    ----------
+    from_idx, to_idx : np.array
+        Positional start and end node of every edge.
+    n_nodes : int
+        Number of nodes.
+    root : int
+        Positional index of the root node.
+
+    Returns
+    -------
+    order : np.array
+        Nodes in breadth first order, starting with the root.
+    parent : np.array
+        Parent node of every node, -1 for the root.
+    parent_edge : np.array
+        Edge connecting every node to its parent, -1 for the root.
+    """
+    n_edges = len(from_idx)
+    if n_edges != n_nodes - 1:
+        raise ValueError('Network is not a tree: {} nodes and {} edges.'
+                         .format(n_nodes, n_edges))
+
+    # undirected adjacency, storing edge number + 1 to tell it apart from 0
+    edge_ids = np.arange(1, n_edges + 1)
+    adjacency = sp.csr_matrix((np.concatenate([edge_ids, edge_ids]),
+                               (np.concatenate([from_idx, to_idx]),
+                                np.concatenate([to_idx, from_idx]))),
+                              shape=(n_nodes, n_nodes))
+
+    order, parent = breadth_first_order(adjacency, root, directed=False,
+                                        return_predecessors=True)
+    if len(order) != n_nodes:
+        raise ValueError('Network is not a tree: it is not connected.')
+
+    parent = np.where(parent < 0, -1, parent)
+    children = order[1:]
+    parent_edge = np.full(n_nodes, -1, dtype=np.int64)
+    parent_edge[children] = np.asarray(
+        adjacency[parent[children], children]).ravel() - 1
+
+    return order, parent, parent_edge
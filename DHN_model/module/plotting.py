@@ -2,20 +2,82 @@ import networkx as nx
 from math import sqrt
 import matplotlib.pyplot as plt
 import matplotlib.collections as collections
+import matplotlib.animation as animation
 import pandas as pd
 import numpy as np
 
-def draw_network(G, node_sizes, node_colors, edge_colors, edge_width, figsize):
+def node_coordinates(G, x='lon', y='lat'):
+    """
+    Coordinates of all nodes as arrays, ordered like G.nodes.
+    """
+    xs = np.array([value for _, value in G.nodes(data=x)], dtype=float)
+    ys = np.array([value for _, value in G.nodes(data=y)], dtype=float)
+    return xs, ys
+
+
+def edge_segments(G, x='lon', y='lat'):
+    """
+    Straight node to node segments of all edges, ordered like G.edges.
+
+    Returns
+    -------
+    segments : np.array
+        Array of shape (edges, 2, 2) that can be passed to a LineCollection.
+    """
+    node_index = {node: i for i, node in enumerate(G.nodes)}
+    uv = np.array([(node_index[u], node_index[v]) for u, v in G.edges()],
+                  dtype=np.int64).reshape(-1, 2)
+    xs, ys = node_coordinates(G, x=x, y=y)
+    return np.stack([np.stack([xs[uv[:, 0]], ys[uv[:, 0]]], axis=-1),
+                     np.stack([xs[uv[:, 1]], ys[uv[:, 1]]], axis=-1)], axis=1)
+
+
+def decimate_segments(segments, max_segments):
+    """
+    Level of detail: keep the max_segments longest segments, which
+    dominate the picture at city scale.
+
+    Returns
+    -------
+    keep : np.array
+        Indices of the kept segments in their original order.
+    """
+    if max_segments is None or len(segments) <= max_segments:
+        return np.arange(len(segments))
+    length = np.hypot(*(segments[:, 1] - segments[:, 0]).T)
+    keep = np.argpartition(length, -max_segments)[-max_segments:]
+    return np.sort(keep)
+
+
+def draw_network(G, node_sizes, node_colors, edge_colors, edge_width, figsize,
+                 label_threshold=100, arrow_threshold=1000):
+    """
+    Draw the network with networkx at the node coordinates.
+
+    Node labels and edge arrows are drawn as one artist per node or edge,
+    so they are skipped for networks with more than label_threshold nodes
+    and arrow_threshold edges, respectively. Pass None to always draw
+    them.
+    """
     # pos = nx.circular_layout(G)
     # pos = nx.spring_layout(G)
     # pos = nx.fruchterman_reingold_layout(G.to_undirected())
-    pos = {node_id: np.array([data['lon'], data['lat']]) for node_id, data in G.nodes(data=True)}
+    xs, ys = node_coordinates(G)
+    pos = dict(zip(G.nodes, np.column_stack([xs, ys])))
     fig = plt.figure(figsize=figsize)
     nodes = nx.draw_networkx_nodes(G, pos, node_size=node_sizes, node_color=node_colors)
-    labels = nx.draw_networkx_labels(G, pos, font_color='w')
-    edges = nx.draw_networkx_edges(G, pos, node_size=node_sizes, arrowstyle='->',
-                                   arrowsize=10, edge_color=edge_colors,
-                                   edge_cmap=plt.cm.hot, width=edge_width)
+
+    # labels and arrow patches are drawn one artist per node/edge, so they
+    # are skipped for large networks
+    if label_threshold is None or len(G) <= label_threshold:
+        labels = nx.draw_networkx_labels(G, pos, font_color='w')
+    if arrow_threshold is None or G.number_of_edges() <= arrow_threshold:
+        arrow_kwargs = {'arrows': True, 'arrowstyle': '->', 'arrowsize': 10}
+    else:
+        arrow_kwargs = {'arrows': False}
+    edges = nx.draw_networkx_edges(G, pos, node_size=node_sizes, edge_color=edge_colors,
+                                   edge_cmap=plt.cm.hot, width=edge_width,
+                                   **arrow_kwargs)
 
 
     ax = plt.gca()
@@ -28,32 +90,150 @@ def draw_network(G, node_sizes, node_colors, edge_colors, edge_width, figsize):
 def draw_G(G, fig_width, fig_height, bgcolor='w',
                use_geom=False, edge_color='b', edge_linewidth=1,
                edge_alpha=1, node_size=3, node_color='r', node_alpha=1,
-               node_edgecolor='r', node_zorder=1):
+               node_edgecolor='r', node_zorder=1, max_edges=None,
+               max_nodes=None, rasterized=False):
+    """
+    Draw the network with straight edges from node coordinates.
 
+    Parameters
+    ----------
+    max_edges : int
+        If not None, only the longest max_edges edges are drawn.
+    max_nodes : int
+        If not None, nodes are only drawn for networks with at most
+        max_nodes nodes.
+    rasterized : bool
+        If True, edges and nodes are rasterized in vector output, which
+        keeps file size and render time bounded for large networks.
+    """
     fig, ax = plt.subplots(figsize=(fig_width, fig_height), facecolor=bgcolor)
-    lines = []
-    for u, v, data in G.edges(data=True):
-        if 'geometry' in data and use_geom:
-            # if it has a geometry attribute (a list of line segments), add them
-            # to the list of lines to plot
-            xs, ys = data['geometry'].xy
-            lines.append(list(zip(xs, ys)))
-        else:
-            # if it doesn't have a geometry attribute, the edge is a straight
-            # line from node to node
-            x1 = G.nodes[u]['lon']
-            y1 = G.nodes[u]['lat']
-            x2 = G.nodes[v]['lon']
-            y2 = G.nodes[v]['lat']
-            line = [(x1, y1), (x2, y2)]
-            lines.append(line)
+
+    # straight node to node lines are built from coordinate arrays
+    segments = edge_segments(G)
+    lines = segments
+    if use_geom:
+        lines = list(segments)
+        for i, (u, v, data) in enumerate(G.edges(data=True)):
+            if 'geometry' in data:
+                # if it has a geometry attribute (a list of line segments), use
+                # it instead of the straight line
+                xs, ys = data['geometry'].xy
+                lines[i] = np.column_stack([xs, ys])
+
+    keep = decimate_segments(segments, max_edges)
+    if len(keep) < len(segments):
+        lines = segments[keep] if not use_geom else [lines[i] for i in keep]
+        # per edge colors and widths are decimated alike
+        if not isinstance(edge_color, str) and np.ndim(edge_color) > 0 \
+                and len(edge_color) == len(segments):
+            edge_color = np.asarray(edge_color)[keep]
+        if np.ndim(edge_linewidth) > 0 and len(edge_linewidth) == len(segments):
+            edge_linewidth = np.asarray(edge_linewidth)[keep]
 
     # add the lines to the axis as a linecollection
-    lc = collections.LineCollection(lines, colors=edge_color, linewidths=edge_linewidth, alpha=edge_alpha, zorder=2)
+    lc = collections.LineCollection(lines, colors=edge_color, linewidths=edge_linewidth,
+                                    alpha=edge_alpha, zorder=2, rasterized=rasterized)
     ax.add_collection(lc)
 
-    node_Xs = [float(x) for _, x in G.nodes(data='lon')]
-    node_Ys = [float(y) for _, y in G.nodes(data='lat')]
-    ax.scatter(node_Xs, node_Ys, s=node_size, c=node_color, alpha=node_alpha, edgecolor=node_edgecolor, zorder=node_zorder)
+    if max_nodes is None or len(G) <= max_nodes:
+        node_Xs, node_Ys = node_coordinates(G)
+        ax.scatter(node_Xs, node_Ys, s=node_size, c=node_color, alpha=node_alpha,
+                   edgecolor=node_edgecolor, zorder=node_zorder, rasterized=rasterized)
+    ax.autoscale_view()
+
+    plt.show()
+
+
+def animate_network(G, edge_values, node_values=None, filename=None,
+                    fig_width=6, fig_height=6, bgcolor='w', edge_cmap='hot',
+                    edge_linewidth=2, node_cmap='viridis', node_size=3,
+                    labels=None, interval=50, fps=24, dpi=100):
+    """
+    Animate time series of edge and node values on the network.
+
+    The node and edge artists are created once, every frame only updates
+    their color (and width) arrays, so that long time series can be
+    rendered. Color limits are fixed over the whole time series.
+
+    Parameters
+    ----------
+    G : networkx MultiDiGraph
+    edge_values : np.array
+        Values to color the edges by, edges x timesteps, ordered like
+        G.edges, e.g. the result of
+        ``simulation.hydraulics_known_flows_wo_loops_batch``.
+    node_values : np.array
+        Values to color the nodes by, nodes x timesteps. If None, the nodes
+        are not animated.
+    filename : str
+        If None, the animation is only returned. If it contains a '%'
+        format, e.g. 'frames/flows_%04d.png', every frame is written to a
+        file of its own. Otherwise the animation is saved as a video (e.g.
+        '.mp4' with ffmpeg or '.gif' with pillow).
+    edge_linewidth : float or np.array
+        Scalar or edges x timesteps array of line widths.
+    labels : list
+        Frame labels, shown in the upper left corner of the axes, default
+        is the timestep number.
+
+    Returns
+    -------
+    matplotlib.animation.FuncAnimation
+    """
+    edge_values = np.asarray(edge_values, dtype=float)
+    edge_linewidth = np.asarray(edge_linewidth, dtype=float)
+    n_steps = edge_values.shape[1]
+    animate_width = edge_linewidth.ndim == 2
+    if labels is None:
+        labels = ['t={}'.format(t) for t in range(n_steps)]
+
+    fig, ax = plt.subplots(figsize=(fig_width, fig_height), facecolor=bgcolor)
+    ax.set_axis_off()
+
+    lc = collections.LineCollection(edge_segments(G), cmap=edge_cmap, zorder=2,
+                                    linewidths=edge_linewidth[:, 0] if animate_width
+                                    else edge_linewidth)
+    lc.set_array(edge_values[:, 0])
+    lc.set_clim(np.nanmin(edge_values), np.nanmax(edge_values))
+    ax.add_collection(lc)
+    artists = [lc]
+
+    node_Xs, node_Ys = node_coordinates(G)
+    if node_values is not None:
+        node_values = np.asarray(node_values, dtype=float)
+        nodes = ax.scatter(node_Xs, node_Ys, s=node_size, c=node_values[:, 0],
+                           cmap=node_cmap, vmin=np.nanmin(node_values),
+                           vmax=np.nanmax(node_values), zorder=3)
+        artists.append(nodes)
+    else:
+        ax.scatter(node_Xs, node_Ys, s=node_size, c='k', zorder=3)
+    ax.autoscale_view()
+    fig.colorbar(lc, ax=ax)
+
+    # inside the axes, blitting only redraws the axes bbox
+    title = ax.text(0.02, 0.98, labels[0], transform=ax.transAxes, ha='left',
+                    va='top', zorder=4,
+                    bbox=dict(facecolor=bgcolor, edgecolor='none', alpha=0.7))
+    artists.append(title)
+
+    def update(t):
+        lc.set_array(edge_values[:, t])
+        if animate_width:
+            lc.set_linewidths(edge_linewidth[:, t])
+        if node_values is not None:
+            nodes.set_array(node_values[:, t])
+        title.set_text(labels[t])
+        return artists
+
+    anim = animation.FuncAnimation(fig, update, frames=n_steps,
+                                   interval=interval, blit=True)
+
+    if filename is not None:
+        if '%' in filename:
+            for t in range(n_steps):
+                update(t)
+                fig.savefig(filename % t, dpi=dpi, facecolor=bgcolor)
+        else:
+            anim.save(filename, fps=fps, dpi=dpi)
 
-    plt.show()
\ No newline at end of file
+    return anim
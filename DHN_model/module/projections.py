@@ -9,6 +9,171 @@ from shapely.geometry import LineString
 import time
 import geopandas as gpd
 import math
+import pyproj
+import shapely
+from functools import lru_cache
+
+
+default_crs = 'epsg:4326'
+
+# zones are looked up once per dataset name, see utm_crs
+_utm_zones = {}
+
+
+def _crs_key(crs):
+    """
+    Hashable key for a crs given as dict, string or pyproj CRS.
+    """
+    if isinstance(crs, dict):
+        return tuple(sorted(crs.items()))
+    if isinstance(crs, pyproj.CRS):
+        return crs.to_wkt()
+    return crs
+
+
+@lru_cache(maxsize=128)
+def _cached_transformer(crs_key, to_crs_key):
+    crs = dict(crs_key) if isinstance(crs_key, tuple) else crs_key
+    to_crs = dict(to_crs_key) if isinstance(to_crs_key, tuple) else to_crs_key
+    return pyproj.Transformer.from_crs(pyproj.CRS.from_user_input(crs),
+                                       pyproj.CRS.from_user_input(to_crs),
+                                       always_xy=True)
+
+
+def get_transformer(crs, to_crs):
+    """
+    Get a coordinate transformer from crs to to_crs. Transformers are
+    cached per (crs, to_crs) pair, so only the first call pays for the setup.
+    Parameters
+    ----------
+    crs : dict or str or pyproj.CRS
+    to_crs : dict or str or pyproj.CRS
+    Returns
+    -------
+    pyproj.Transformer
+        transformer with x/y (lon/lat) axis order
+    """
+    return _cached_transformer(_crs_key(crs), _crs_key(to_crs))
+
+
+def utm_crs(longitude, dataset=None):
+    """
+    Get the UTM CRS of the zone containing a longitude.
+    Parameters
+    ----------
+    longitude : float or callable
+        longitude in degrees, or a function returning it, which is only
+        called if the zone of the dataset is not cached yet
+    dataset : hashable
+        if not None, the zone is computed once for this dataset name and
+        reused on later calls
+    Returns
+    -------
+    dict
+    """
+    if dataset is not None and dataset in _utm_zones:
+        utm_zone = _utm_zones[dataset]
+    else:
+        if callable(longitude):
+            longitude = longitude()
+        utm_zone = int(math.floor((longitude + 180) / 6.) + 1)
+        if dataset is not None:
+            _utm_zones[dataset] = utm_zone
+
+    return {'datum': 'WGS84',
+            'ellps': 'WGS84',
+            'proj' : 'utm',
+            'zone' : utm_zone,
+            'units': 'm'}
+
+
+def _is_utm(crs):
+    if crs is None:
+        return False
+    if isinstance(crs, dict):
+        return crs.get('proj') == 'utm'
+    return pyproj.CRS.from_user_input(crs).utm_zone is not None
+
+
+def project_coords(x, y, crs=None, to_crs=None, to_latlong=False, dataset=None):
+    """
+    Project arrays of coordinates from lat-long to UTM, or vice-versa,
+    without building any geometries.
+    Parameters
+    ----------
+    x : array-like
+        x coordinates (longitude)
+    y : array-like
+        y coordinates (latitude)
+    crs : dict
+        the coordinate reference system of the coordinates, default value
+        (None) will set default_crs as the CRS
+    to_crs : dict
+        if not None, just project to this CRS instead of to UTM
+    to_latlong : bool
+        if True, project from crs to lat-long, if False, project from crs to
+        local UTM zone
+    dataset : hashable
+        name of the dataset to cache the UTM zone for, see utm_crs
+    Returns
+    -------
+    tuple
+        (x_proj, y_proj, crs), the projected coordinates and the crs of the
+        projected coordinates
+    """
+    if crs is None:
+        crs = default_crs
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    if to_crs is None:
+        if to_latlong:
+            to_crs = default_crs
+        elif _is_utm(crs):
+            return x, y, crs
+        else:
+            # the zone is taken from the average longitude of the points,
+            # which assumes that crs is lat-long
+            to_crs = utm_crs(lambda: np.nanmean(x), dataset=dataset)
+
+    x_proj, y_proj = get_transformer(crs, to_crs).transform(x, y)
+    return x_proj, y_proj, to_crs
+
+
+def project_geometries(geometries, crs=None, to_crs=None, to_latlong=False,
+                       dataset=None):
+    """
+    Project an array of shapely geometries from lat-long to UTM, or
+    vice-versa. The coordinates of all geometries are transformed in one
+    batch.
+    Parameters
+    ----------
+    geometries : array-like of shapely geometries
+        the geometries to project
+    crs : dict
+        the starting coordinate reference system of the passed-in geometries,
+        default value (None) will set default_crs as the CRS
+    to_crs : dict
+        if not None, just project to this CRS instead of to UTM
+    to_latlong : bool
+        if True, project from crs to lat-long, if False, project from crs to
+        local UTM zone
+    dataset : hashable
+        name of the dataset to cache the UTM zone for, see utm_crs
+    Returns
+    -------
+    tuple
+        (geometries_proj, crs), the projected geometries and the crs of the
+        projected geometries
+    """
+    # copy, set_coordinates replaces the geometries in the array
+    geometries_proj = np.array(geometries, dtype=object)
+    coords = shapely.get_coordinates(geometries_proj)
+    x, y, crs_proj = project_coords(coords[:, 0], coords[:, 1], crs=crs,
+                                    to_crs=to_crs, to_latlong=to_latlong,
+                                    dataset=dataset)
+    shapely.set_coordinates(geometries_proj, np.column_stack([x, y]))
+    return geometries_proj, crs_proj
 
 
 def project_geometry(geometry, crs=None, to_crs=None, to_latlong=False):
@@ -21,7 +186,7 @@ def project_geometry(geometry, crs=None, to_crs=None, to_latlong=False):
         the geometry to project
     crs : dict
         the starting coordinate reference system of the passed-in geometry,
-        default value (None) will set settings.default_crs as the CRS
+        default value (None) will set default_crs as the CRS
     to_crs : dict
         if not None, just project to this CRS instead of to UTM
     to_latlong : bool
@@ -33,21 +198,13 @@ def project_geometry(geometry, crs=None, to_crs=None, to_latlong=False):
         (geometry_proj, crs), the projected shapely geometry and the crs of the
         projected geometry
     """
-
-    if crs is None:
-        crs = settings.default_crs
-
-    gdf = gpd.GeoDataFrame()
-    gdf.crs = crs
-    gdf.gdf_name = 'geometry to project'
-    gdf['geometry'] = None
-    gdf.loc[0, 'geometry'] = geometry
-    gdf_proj = project_gdf(gdf, to_crs=to_crs, to_latlong=to_latlong)
-    geometry_proj = gdf_proj['geometry'].iloc[0]
-    return geometry_proj, gdf_proj.crs
+    geometries_proj, crs_proj = project_geometries([geometry], crs=crs,
+                                                   to_crs=to_crs,
+                                                   to_latlong=to_latlong)
+    return geometries_proj[0], crs_proj
 
 
-def project_gdf(gdf, to_crs=None, to_latlong=False):
+def project_gdf(gdf, to_crs=None, to_latlong=False, dataset=None):
     """
     Project a GeoDataFrame to the UTM zone appropriate for its geometries'
     centroid.
@@ -62,12 +219,13 @@ def project_gdf(gdf, to_crs=None, to_latlong=False):
         if not None, just project to this CRS instead of to UTM
     to_latlong : bool
         if True, projects to latlong instead of to UTM
+    dataset : hashable
+        name of the dataset to cache the UTM zone for, see utm_crs
     Returns
     -------
     GeoDataFrame
     """
     assert len(gdf) > 0, 'You cannot project an empty GeoDataFrame.'
-    start_time = time.time()
 
     # if gdf has no gdf_name attribute, create one now
     if not hasattr(gdf, 'gdf_name'):
@@ -82,29 +240,23 @@ def project_gdf(gdf, to_crs=None, to_latlong=False):
     else:
         if to_latlong:
             # if to_latlong is True, project the gdf to latlong
-            latlong_crs = settings.default_crs
-            projected_gdf = gdf.to_crs(latlong_crs)
+            projected_gdf = gdf.to_crs(default_crs)
         else:
             # else, project the gdf to UTM
             # if GeoDataFrame is already in UTM, just return it
-            if (gdf.crs is not None) and ('proj' in gdf.crs) and (gdf.crs['proj'] == 'utm'):
+            if _is_utm(gdf.crs):
                 return gdf
 
-            # calculate the centroid of the union of all the geometries in the
-            # GeoDataFrame
-            avg_longitude = gdf['geometry'].unary_union.centroid.x
-
-            # calculate the UTM zone from this avg longitude and define the UTM
-            # CRS to project
-            utm_zone = int(math.floor((avg_longitude + 180) / 6.) + 1)
-            utm_crs = {'datum': 'WGS84',
-                       'ellps': 'WGS84',
-                       'proj' : 'utm',
-                       'zone' : utm_zone,
-                       'units': 'm'}
+            # calculate the UTM zone from the center of the bounds of all the
+            # geometries in the GeoDataFrame, which is much cheaper than the
+            # centroid of their union and falls into the same zone for
+            # city-scale data
+            def avg_longitude():
+                minx, _, maxx, _ = gdf.total_bounds
+                return 0.5 * (minx + maxx)
 
             # project the GeoDataFrame to the UTM CRS
-            projected_gdf = gdf.to_crs(utm_crs)
+            projected_gdf = gdf.to_crs(utm_crs(avg_longitude, dataset=dataset))
             
     projected_gdf.gdf_name = gdf.gdf_name
     return projected_gdf
@@ -128,65 +280,63 @@ def project_graph(G, to_crs=None):
     G_proj = G.copy()
 
     # create a GeoDataFrame of the nodes, name it, convert osmid to str
-    nodes = {node:data for node, data in G_proj.nodes(data=True)}
-    gdf_nodes = gpd.GeoDataFrame(nodes).T
-    gdf_nodes.crs = G_proj.graph['crs']
-    gdf_nodes.gdf_name = '{}_nodes'.format(G_proj.name)
+    gdf_nodes = pd.DataFrame.from_dict(dict(G_proj.nodes(data=True)), orient='index')
     # gdf_nodes['osmid'] = gdf_nodes['osmid'].astype(np.int64).map(make_str)
 
     # create a geometry column from x/y
-    gdf_nodes['geometry'] = gdf_nodes.apply(lambda row: Point(row['lon'], row['lat']), axis=1)
+    geometry = gpd.points_from_xy(gdf_nodes['lon'].astype(float),
+                                  gdf_nodes['lat'].astype(float))
+    gdf_nodes = gpd.GeoDataFrame(gdf_nodes, geometry=geometry,
+                                 crs=G_proj.graph['crs'])
+    gdf_nodes.gdf_name = '{}_nodes'.format(G_proj.name)
 
     # project the nodes GeoDataFrame to UTM
     gdf_nodes_utm = project_gdf(gdf_nodes, to_crs=to_crs)
 
     # extract data for all edges that have geometry attribute
-    edges_with_geom = []
-    for u, v, key, data in G_proj.edges(keys=True, data=True):
-        if 'geometry' in data:
-            edges_with_geom.append({'u':u, 'v':v, 'key':key, 'geometry':data['geometry']})
-
-    # create an edges GeoDataFrame and project to UTM, if there were any edges
-    # with a geometry attribute. geom attr only exists if graph has been
-    # simplified, otherwise you don't have to project anything for the edges
-    # because the nodes still contain all spatial data
+    edges = list(G_proj.edges(keys=True, data=True))
+    edges_with_geom = [(u, v, key, data['geometry'])
+                       for u, v, key, data in edges if 'geometry' in data]
+
+    # create an edges GeoDataFrame indexed by (u, v, key) and project to UTM,
+    # if there were any edges with a geometry attribute. geom attr only
+    # exists if graph has been simplified, otherwise you don't have to
+    # project anything for the edges because the nodes still contain all
+    # spatial data
     if len(edges_with_geom) > 0:
-        gdf_edges = gpd.GeoDataFrame(edges_with_geom)
-        gdf_edges.crs = G_proj.graph['crs']
+        u, v, key, geometry = zip(*edges_with_geom)
+        gdf_edges = gpd.GeoDataFrame(
+            geometry=list(geometry), crs=G_proj.graph['crs'],
+            index=pd.MultiIndex.from_arrays([u, v, key], names=['u', 'v', 'key']))
         gdf_edges.gdf_name = '{}_edges'.format(G_proj.name)
         gdf_edges_utm = project_gdf(gdf_edges, to_crs=to_crs)
+        edge_geometry_utm = dict(zip(gdf_edges_utm.index,
+                                     gdf_edges_utm.geometry.values))
 
     # extract projected x and y values from the nodes' geometry column
-    start_time = time.time()
-    gdf_nodes_utm['x'] = gdf_nodes_utm['geometry'].map(lambda point: point.x)
-    gdf_nodes_utm['y'] = gdf_nodes_utm['geometry'].map(lambda point: point.y)
-    gdf_nodes_utm = gdf_nodes_utm.drop('geometry', axis=1)
+    gdf_nodes_utm['x'] = gdf_nodes_utm.geometry.x
+    gdf_nodes_utm['y'] = gdf_nodes_utm.geometry.y
+    crs_utm = gdf_nodes_utm.crs
+    gdf_nodes_utm = pd.DataFrame(gdf_nodes_utm.drop(columns='geometry'))
  
     # clear the graph to make it a blank slate for the projected data
-    start_time = time.time()
-    edges = list(G_proj.edges(keys=True, data=True))
     graph_name = G_proj.graph['name']
     G_proj.clear()
 
-    # add the projected nodes and all their attributes to the graph
-    G_proj.add_nodes_from(gdf_nodes_utm.index)
-    attributes = gdf_nodes_utm.to_dict()
-    for label in gdf_nodes_utm.columns:
-        nx.set_node_attributes(G_proj, name=label, values=attributes[label])
+    # add the projected nodes and all their attributes to the graph at once
+    G_proj.add_nodes_from(zip(gdf_nodes_utm.index,
+                              gdf_nodes_utm.to_dict('records')))
 
     # add the edges and all their attributes (including reconstructed geometry,
     # when it exists) to the graph
     for u, v, key, attributes in edges:
         if 'geometry' in attributes:
-            row = gdf_edges_utm[(gdf_edges_utm['u']==u) & (gdf_edges_utm['v']==v) & (gdf_edges_utm['key']==key)]
-            attributes['geometry'] = row['geometry'].iloc[0]
-
-        # attributes dict contains key, so we don't need to explicitly pass it here
-        G_proj.add_edge(u, v, **attributes)
+            attributes['geometry'] = edge_geometry_utm[(u, v, key)]
+    G_proj.add_edges_from(edges)
 
     # set the graph's CRS attribute to the new, projected CRS and return the
     # projected graph
-    G_proj.graph['crs'] = gdf_nodes_utm.crs
+    G_proj.graph['crs'] = crs_utm
     G_proj.graph['name'] = '{}_UTM'.format(graph_name)
         
     return G_proj
\ No newline at end of file
@@ -1,8 +1,13 @@
 import networkx as nx
 import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu, spsolve
+
+from .friction import lamb_func
+from .network import CompiledNetwork, tree_order
 
 def hydraulics_known_flows_wo_loops(G, m_node):
-    A = nx.incidence_matrix(G, oriented=True).todense()
+    A = incidence_matrix(G).todense()
     m_node[0] = - np.sum(m_node[1:])
     print(m_node.shape)
     print(A.shape)
@@ -10,7 +15,7 @@ def hydraulics_known_flows_wo_loops(G, m_node):
     return flows
 
 def hydraulics_known_flows_wo_loops_v2(G, m_node):
-    A = nx.incidence_matrix(G, oriented=True).todense()
+    A = incidence_matrix(G).todense()
     A = A[1:,:]
     m_node = m_node[1:]
     flows = np.linalg.solve(A, m_node)
@@ -18,7 +23,7 @@ def hydraulics_known_flows_wo_loops_v2(G, m_node):
 
 def hydraulics_known_flows_wo_loops_sparse(G, m_node):
     import scipy
-    A = nx.incidence_matrix(G, oriented=True)
+    A = incidence_matrix(G)
     A = A[1:,:]
     m_node = m_node[1:]
     flows = scipy.sparse.linalg.spsolve(A, m_node)
@@ -26,9 +31,397 @@ def hydraulics_known_flows_wo_loops_sparse(G, m_node):
 
 
 def hydraulics_known_flows_wo_loops_prop_to_edges(G, m_node):
-    A = nx.incidence_matrix(G, oriented=True).todense()
+    A = incidence_matrix(G).todense()
     A = A[1:,:]
     m_node = m_node[1:]
     flows = np.linalg.solve(A, m_node)
     G = properties_to_edges(G, {'mass_flows': flows})
     return flows
+
+
+def incidence_matrix(G):
+    r"""
+    Oriented incidence matrix of a graph or a CompiledNetwork.
+
+    The matrix of a CompiledNetwork is cached, a graph is traversed on
+    every call.
+    """
+    if isinstance(G, CompiledNetwork):
+        return G.incidence
+    return nx.incidence_matrix(G, oriented=True)
+
+
+def edge_node_indices(G):
+    r"""
+    Positional indices of the start and end node of every edge.
+
+    The ordering of nodes and edges is the same as in
+    ``nx.incidence_matrix(G)``, so the results can be used
+    interchangeably with the incidence matrix based functions.
+
+    Parameters
+    ----------
+    G : networkx MultiDiGraph or CompiledNetwork
+
+    Returns
+    -------
+    from_idx : np.array
+    to_idx : np.array
+    """
+    if isinstance(G, CompiledNetwork):
+        return G.from_idx, G.to_idx
+    node_index = {node: i for i, node in enumerate(G.nodes)}
+    edges = np.array([(node_index[u], node_index[v]) for u, v in G.edges()],
+                     dtype=np.int64).reshape(-1, 2)
+    return edges[:, 0], edges[:, 1]
+
+
+def hydraulics_known_flows_tree(G, m_node):
+    r"""
+    Mass flows in a tree network with known consumer mass flows.
+
+    Instead of solving the incidence matrix system, the consumer mass
+    flows are accumulated from the leaves towards the first node
+    (the producer), which is O(n). The first node balances the network,
+    as in ``hydraulics_known_flows_wo_loops_v2``, and the returned flows
+    are the same.
+
+    Parameters
+    ----------
+    G : networkx MultiDiGraph or CompiledNetwork
+        Tree network.
+    m_node : np.array
+        Mass flow leaving the network at every node, ordered like G.nodes.
+
+    Returns
+    -------
+    flows : np.array
+        Mass flow in every edge, ordered like G.edges. Negative values
+        indicate flow against the edge direction.
+    """
+    from_idx, to_idx = edge_node_indices(G)
+    if isinstance(G, CompiledNetwork):
+        order, parent, parent_edge = G.tree
+    else:
+        order, parent, parent_edge = tree_order(from_idx, to_idx, len(G.nodes))
+
+    # walk the breadth first order backwards, so that every node has
+    # collected the flows of its whole subtree before passing it on
+    subtree_flow = np.array(m_node, dtype=float).ravel().tolist()
+    parent_list = parent.tolist()
+    for node in order[:0:-1].tolist():
+        subtree_flow[parent_list[node]] += subtree_flow[node]
+    subtree_flow = np.array(subtree_flow)
+
+    children = order[1:]
+    edges = parent_edge[children]
+    flows = np.empty(len(from_idx))
+    direction = np.where(to_idx[edges] == children, 1., -1.)
+    flows[edges] = direction * subtree_flow[children]
+    return flows
+
+
+def factorize_reduced_incidence(G):
+    r"""
+    LU factorization of the incidence matrix without the first row.
+
+    The factorization only depends on the topology, so it can be reused
+    for any number of demand vectors, see
+    ``hydraulics_known_flows_wo_loops_batch``.
+
+    Parameters
+    ----------
+    G : networkx MultiDiGraph or CompiledNetwork
+        Network without loops.
+
+    Returns
+    -------
+    lu : scipy.sparse.linalg.SuperLU
+    """
+    A = incidence_matrix(G)
+    A = sp.csc_matrix(A[1:,:])
+    return splu(A)
+
+
+def hydraulics_known_flows_wo_loops_batch(G, m_node, lu=None):
+    r"""
+    Mass flows for many timesteps with known consumer mass flows.
+
+    The reduced incidence matrix is factorized once and all timesteps are
+    solved in one batched back-substitution.
+
+    Parameters
+    ----------
+    G : networkx MultiDiGraph or CompiledNetwork
+        Network without loops.
+    m_node : np.array
+        Mass flow leaving the network, nodes x timesteps.
+    lu : scipy.sparse.linalg.SuperLU
+        Factorization from ``factorize_reduced_incidence``. If None, it is
+        computed here.
+
+    Returns
+    -------
+    flows : np.array
+        Mass flows, edges x timesteps.
+    """
+    if lu is None:
+        lu = factorize_reduced_incidence(G)
+    m_node = np.asarray(m_node, dtype=float)
+    if m_node.ndim == 1:
+        m_node = m_node[:, np.newaxis]
+    flows = lu.solve(np.ascontiguousarray(m_node[1:]))
+    return flows
+
+
+def pipe_properties(G):
+    r"""
+    Length, diameter and roughness of every edge in SI units.
+
+    Parameters
+    ----------
+    G : networkx MultiDiGraph or CompiledNetwork
+
+    Returns
+    -------
+    L : np.array
+        Length [m]
+    D : np.array
+        Diameter [m]
+    eps : np.array
+        Roughness [m]
+    """
+    if isinstance(G, CompiledNetwork):
+        return G.length, G.diameter, G.roughness
+    data = [(d['lenght_m'], d['diameter_mm'], d['roughness_mm'])
+            for u, v, d in G.edges(data=True)]
+    L, D, eps = np.array(data, dtype=float).reshape(-1, 3).T
+    return L, 1e-3 * D, 1e-3 * eps
+
+
+def pressure_drop(m, L, D, eps, rho=951, mu=0.255e-3, Re_min=2300,
+                  friction_factor=lamb_func):
+    r"""
+    Pressure drop along pipes in flow direction and its derivative.
+
+    Parameters
+    ----------
+    m : np.array
+        Mass flow [kg/s], negative against the edge direction.
+    L, D, eps : np.array
+        Length, diameter and roughness [m].
+    rho : float
+        Density [kg/m3]
+    mu : float
+        Dynamic viscosity [Pa s]
+    Re_min : float
+        Smaller Reynolds numbers are raised to this value to keep the
+        friction factor approximation finite.
+    friction_factor : function
+        Friction factor as function of (eps, D, Re), e.g. one of the
+        functions in the friction module or a friction.ColebrookTable.
+
+    Returns
+    -------
+    dp : np.array
+        Pressure drop [Pa], with the sign of m.
+    ddp_dm : np.array
+        Derivative of the pressure drop with respect to m, keeping the
+        friction factor constant.
+    """
+    Re = np.maximum(4 * np.abs(m) / (np.pi * D * mu), Re_min)
+    lamb = friction_factor(eps, D, Re)
+    r = lamb * 8*L * 1/(rho*np.pi**2*D**5)
+    dp = r * m * np.abs(m)
+    ddp_dm = 2 * r * np.abs(m)
+    return dp, ddp_dm
+
+
+def hydraulics_known_flows_with_loops(G, m_node, rho=951, mu=0.255e-3,
+                                      tol=1e-8, max_iter=50,
+                                      friction_factor=lamb_func):
+    r"""
+    Mass flows and pressures in a meshed network with known consumer
+    mass flows.
+
+    Mass conservation at every node and pressure balance around every
+    loop are solved jointly with the global gradient algorithm
+    (Todini & Pilati), a Newton method on flows and node pressures.
+    Each iteration solves one sparse symmetric system of the size of
+    the number of nodes. The first node balances the network and has
+    the reference pressure 0.
+
+    Parameters
+    ----------
+    G : networkx MultiDiGraph or CompiledNetwork
+    m_node : np.array
+        Mass flow leaving the network at every node, ordered like G.nodes.
+    rho : float
+        Density [kg/m3]
+    mu : float
+        Dynamic viscosity [Pa s]
+    tol : float
+        Convergence tolerance on the relative flow update.
+    max_iter : int
+        Maximum number of Newton iterations.
+    friction_factor : function
+        Friction factor as function of (eps, D, Re), see pressure_drop.
+
+    Returns
+    -------
+    flows : np.array
+        Mass flow in every edge [kg/s], ordered like G.edges.
+    pressure : np.array
+        Pressure at every node relative to the first node [Pa].
+    """
+    A = sp.csr_matrix(incidence_matrix(G))
+    A_r = A[1:,:]
+    m_r = np.asarray(m_node, dtype=float).ravel()[1:]
+    L, D, eps = pipe_properties(G)
+
+    # start from the minimum norm flows, which satisfy mass conservation
+    flows = A_r.T @ spsolve(sp.csc_matrix(A_r @ A_r.T), m_r)
+    pressure_r = np.zeros(A_r.shape[0])
+
+    # lower bound of the derivative, for edges without flow
+    min_flow = 1e-6 * max(np.abs(m_r).max(), 1e-12)
+
+    for i in range(max_iter):
+        dp, ddp_dm = pressure_drop(flows, L, D, eps, rho=rho, mu=mu,
+                                   friction_factor=friction_factor)
+        _, ddp_min = pressure_drop(np.full_like(flows, min_flow),
+                                   L, D, eps, rho=rho, mu=mu,
+                                   friction_factor=friction_factor)
+        inv_jac = 1 / np.maximum(ddp_dm, ddp_min)
+
+        res_energy = dp + A_r.T @ pressure_r
+        res_mass = A_r @ flows - m_r
+
+        schur = A_r @ sp.diags(inv_jac) @ A_r.T
+        d_pressure = spsolve(sp.csc_matrix(schur),
+                             res_mass - A_r @ (inv_jac * res_energy))
+        d_flows = -inv_jac * (res_energy + A_r.T @ d_pressure)
+
+        flows += d_flows
+        pressure_r += d_pressure
+
+        if np.abs(d_flows).max() <= tol * max(np.abs(flows).max(), min_flow):
+            break
+    else:
+        raise RuntimeError('Hydraulic solver did not converge within '
+                           '{} iterations.'.format(max_iter))
+
+    pressure = np.concatenate([[0.], pressure_r])
+    return flows, pressure
+
+
+def hydraulics_timeseries(G, m_node, solver=hydraulics_known_flows_tree,
+                          rtol=1e-3, atol=0., correct=True, max_scale=0.05,
+                          check=False, **kwargs):
+    r"""
+    Solve a series of quasi-static timesteps, skipping the solver for
+    timesteps whose demand hardly changed since the last solve.
+
+    The demand of every timestep is compared to the demand of the last
+    solved timestep. With correct=True, it is first scaled by the factor s
+    that matches it best, and flows are reused as s * flows and pressures
+    as s * |s| * pressure, which is exact for a uniform change of all
+    demands and a constant friction factor. The solver is skipped if the
+    remaining deviation of the demand is below atol + rtol * max(|m_node|)
+    and s differs from 1 by at most max_scale, which bounds the error of
+    neglecting the change of the friction factor.
+
+    The reference is only updated by actual solves, so errors do not
+    accumulate over skipped timesteps.
+
+    Parameters
+    ----------
+    G : networkx MultiDiGraph or CompiledNetwork
+    m_node : np.array
+        Mass flow leaving the network, nodes x timesteps.
+    solver : function
+        Called as solver(G, m_node, **kwargs) for one timestep, returning
+        flows or (flows, pressure), e.g. hydraulics_known_flows_tree or
+        hydraulics_known_flows_with_loops.
+    rtol, atol : float
+        Relative and absolute tolerance on the demand [kg/s].
+    correct : bool
+        Scale the reused solution with the demand, otherwise reuse it as
+        it is.
+    max_scale : float
+        Largest relative change of the demand level that is corrected
+        instead of solved.
+    check : bool
+        Also solve the skipped timesteps, to report the error of the reused
+        solutions. Only for validation, it removes the speedup.
+    **kwargs :
+        Passed to the solver.
+
+    Returns
+    -------
+    flows : np.array
+        Edges x timesteps.
+    pressure : np.array
+        Nodes x timesteps, None if the solver only returns flows.
+    info : dict
+        'n_solved', 'n_skipped', 'skipped' (bool per timestep),
+        'max_imbalance' (largest mass imbalance at a node introduced by
+        reusing [kg/s]) and, with check=True, 'max_error_flows' and
+        'max_error_pressure'.
+    """
+    m_node = np.asarray(m_node, dtype=float)
+    n_steps = m_node.shape[1]
+    flows = None
+    pressure = None
+    skipped = np.zeros(n_steps, dtype=bool)
+    max_imbalance = 0.
+    max_error = {'flows': 0., 'pressure': 0.}
+
+    def solve(m):
+        result = solver(G, m.copy(), **kwargs)
+        return result if isinstance(result, tuple) else (result, None)
+
+    ref_m = None
+    for t in range(n_steps):
+        m = m_node[:, t]
+        m_r = m[1:]
+        if ref_m is not None:
+            s = 1.
+            if correct:
+                norm = ref_m[1:] @ ref_m[1:]
+                s = (m_r @ ref_m[1:]) / norm if norm > 0 else 1.
+            deviation = np.abs(m_r - s * ref_m[1:]).max(initial=0)
+            if (deviation <= atol + rtol * np.abs(m_r).max(initial=0)
+                    and abs(s - 1) <= max_scale):
+                skipped[t] = True
+                max_imbalance = max(max_imbalance, deviation)
+                flows[:, t] = s * ref_flows
+                if pressure is not None:
+                    pressure[:, t] = s * abs(s) * ref_pressure
+                if check:
+                    exact_flows, exact_pressure = solve(m)
+                    max_error['flows'] = max(max_error['flows'], np.abs(
+                        flows[:, t] - exact_flows).max(initial=0))
+                    if exact_pressure is not None:
+                        max_error['pressure'] = max(max_error['pressure'], np.abs(
+                            pressure[:, t] - exact_pressure).max(initial=0))
+                continue
+
+        ref_m = m
+        ref_flows, ref_pressure = solve(m)
+        if flows is None:
+            flows = np.empty((len(ref_flows), n_steps))
+            if ref_pressure is not None:
+                pressure = np.empty((len(ref_pressure), n_steps))
+        flows[:, t] = ref_flows
+        if pressure is not None:
+            pressure[:, t] = ref_pressure
+
+    info = {'n_solved': int((~skipped).sum()),
+            'n_skipped': int(skipped.sum()),
+            'skipped': skipped,
+            'max_imbalance': max_imbalance}
+    if check:
+        info['max_error_flows'] = max_error['flows']
+        info['max_error_pressure'] = max_error['pressure']
+    return flows, pressure, info
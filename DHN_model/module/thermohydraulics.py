@@ -0,0 +1,396 @@
+r"""
+Coupled hydraulic and thermal steady state of a DHN.
+
+Unknowns are the mass flows in the edges, the pressures at the nodes and
+the supply and return temperatures at the nodes. Consumers draw a given
+heat flow with a fixed return temperature, so their mass flow depends on
+the supply temperature that reaches them, and the temperature drop along
+every pipe depends on its mass flow, as in single_pipe:
+
+    T_out = T_amb + (T_in - T_amb) * exp(-k L / (c |m|))
+
+with the heat transfer coefficient k per pipe length [W/mK]. Supply and
+return pipes are assumed identical. The first node is the producer, it
+balances the network at a given supply temperature and has the reference
+pressure 0.
+
+The residual and its sparse Jacobian are assembled from the arrays of a
+CompiledNetwork and solved with Newton's method, either with a direct
+sparse solver or with GMRES and an incomplete LU preconditioner.
+"""
+import warnings
+
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+
+from .friction import lamb_func, lamb_func_dRe
+from .network import CompiledNetwork
+from .simulation import pressure_drop
+
+
+def _split(x, n_edges, n_nodes):
+    E, N = n_edges, n_nodes
+    return x[:E], x[E:E + N - 1], x[E + N - 1:E + 2*N - 1], x[E + 2*N - 1:]
+
+
+def residual_and_jacobian(x, net, Q_node, temp_supply, temp_return_cons,
+                          temp_amb=10., c=4190., rho=951., mu=0.255e-3,
+                          friction_factor=lamb_func, friction_derivative=None,
+                          dT_min=1., m_min=1e-9):
+    r"""
+    Residual of the coupled equations and its sparse Jacobian.
+
+    Parameters
+    ----------
+    x : np.array
+        Mass flows (edges), pressures without the first node, supply
+        temperatures and return temperatures (nodes).
+    net : CompiledNetwork
+    Q_node : np.array
+        Heat demand at every node [W], the first node is ignored.
+    temp_supply : float
+        Supply temperature at the producer [°C]
+    temp_return_cons : float
+        Return temperature behind the consumers [°C]
+    temp_amb : float
+        Ambient temperature [°C]
+    c, rho, mu : float
+        Specific heat capacity [J/(kg K)], density [kg/m3] and dynamic
+        viscosity [Pa s]
+    friction_factor : function
+        See simulation.pressure_drop.
+    friction_derivative : function
+        Derivative of friction_factor with respect to the Reynolds number,
+        with the same signature. Default is friction.lamb_func_dRe for
+        lamb_func. For other friction factors without a derivative, the
+        friction factor is kept constant in the Jacobian, which slows down
+        but does not change the solution.
+    dT_min : float
+        Smallest temperature difference over a consumer [K], to keep its
+        mass flow finite.
+    m_min : float
+        Mass flow [kg/s] added to every pipe in the thermal equations, so
+        that nodes without flow relax to the ambient temperature.
+
+    Returns
+    -------
+    residual : np.array
+    jacobian : scipy.sparse.csr_matrix
+    """
+    E, N = net.n_edges, net.n_nodes
+    m, p_r, T_s, T_r = _split(x, E, N)
+    A_r = net.incidence[1:]
+    nodes = np.arange(N)
+    edges = np.arange(E)
+    # columns of the unknowns, rows are mass (N - 1), pressure (E), supply
+    # and return (N each), so the temperature rows equal their columns
+    i_m, i_p, i_s, i_r = 0, E, E + N - 1, E + 2*N - 1
+
+    # consumers, their mass flow depends on the supply temperature
+    Q = np.asarray(Q_node, dtype=float).copy()
+    Q[0] = 0
+    dT_cons = T_s - temp_return_cons
+    limited = dT_cons < dT_min
+    dT_cons = np.maximum(dT_cons, dT_min)
+    m_cons = Q / (c * dT_cons)
+    dm_cons = np.where(limited, 0, -m_cons / dT_cons)
+
+    # hydraulics, as in hydraulics_known_flows_with_loops
+    dp, ddp_dm = pressure_drop(m, net.length, net.diameter, net.roughness,
+                               rho=rho, mu=mu, friction_factor=friction_factor)
+    # ddp_dm keeps the friction factor constant, add its dependence on the
+    # Reynolds number: d ln(dp) / d ln|m| = 2 + d ln(lambda) / d ln(Re)
+    if friction_derivative is None and friction_factor is lamb_func:
+        friction_derivative = lamb_func_dRe
+    if friction_derivative is not None:
+        Re = np.maximum(4 * np.abs(m) / (np.pi * net.diameter * mu), 2300)
+        dlnlamb = Re * friction_derivative(net.roughness, net.diameter, Re) \
+            / friction_factor(net.roughness, net.diameter, Re)
+        ddp_dm = ddp_dm * np.where(Re > 2300, 1 + 0.5 * dlnlamb, 1)
+    min_flow = 1e-6 * max(Q.sum() / (c * 50.), 1e-12)
+    _, ddp_min = pressure_drop(np.full(E, min_flow), net.length, net.diameter,
+                               net.roughness, rho=rho, mu=mu,
+                               friction_factor=friction_factor)
+    ddp_dm = np.maximum(ddp_dm, ddp_min)
+    res_mass = A_r @ m - m_cons[1:]
+    res_pressure = dp + A_r.T @ p_r
+
+    # pipes, upstream node u and downstream node d in flow direction
+    forward = m >= 0
+    sign = np.where(forward, 1., -1.)
+    u = np.where(forward, net.from_idx, net.to_idx)
+    d = np.where(forward, net.to_idx, net.from_idx)
+    w = np.abs(m) + m_min
+    beta = net.heat_transfer_coefficient * net.length / c
+    a = np.exp(-beta / w)
+    da = a * (1 + beta / w)
+
+    # supply: mixing of the inflows at the downstream node
+    ts_d, ts_u = T_s[d] - temp_amb, T_s[u] - temp_amb
+    res_supply = np.bincount(d, w * (ts_d - a * ts_u), minlength=N) \
+        + m_min * (T_s - temp_amb)
+    res_supply[0] = T_s[0] - temp_supply
+
+    # return: inflows from downstream and from the consumer at a node
+    tr_u, tr_d = T_r[u] - temp_amb, T_r[d] - temp_amb
+    res_return = np.bincount(u, w * (tr_u - a * tr_d), minlength=N) \
+        + m_cons * (T_r - temp_return_cons) + m_min * (T_r - temp_amb)
+
+    residual = np.concatenate([res_mass, res_pressure, res_supply, res_return])
+
+    # Jacobian, as coordinate lists of (row, column, value)
+    A_coo = A_r.tocoo()
+    to_d = d != 0
+    blocks = [
+        # mass
+        (A_coo.row, i_m + A_coo.col, A_coo.data),
+        (nodes[1:] - 1, i_s + nodes[1:], -dm_cons[1:]),
+        # pressure
+        (N - 1 + edges, i_m + edges, ddp_dm),
+        (N - 1 + A_coo.col, i_p + A_coo.row, A_coo.data),
+        # supply
+        (i_s + d[to_d], i_s + d[to_d], w[to_d]),
+        (i_s + d[to_d], i_s + u[to_d], -w[to_d] * a[to_d]),
+        (i_s + d[to_d], i_m + edges[to_d], sign[to_d] * (ts_d - da * ts_u)[to_d]),
+        (i_s + nodes[1:], i_s + nodes[1:], np.full(N - 1, m_min)),
+        (np.array([i_s]), np.array([i_s]), np.ones(1)),
+        # return
+        (i_r + u, i_r + u, w),
+        (i_r + u, i_r + d, -w * a),
+        (i_r + u, i_m + edges, sign * (tr_u - da * tr_d)),
+        (i_r + nodes, i_r + nodes, m_cons + m_min),
+        (i_r + nodes, i_s + nodes, dm_cons * (T_r - temp_return_cons)),
+    ]
+    rows, cols, values = [np.concatenate(b) for b in zip(*blocks)]
+    n = len(x)
+    jacobian = sp.csr_matrix((values, (rows, cols)), shape=(n, n))
+    return residual, jacobian
+
+
+def initial_state(net, Q_node, temp_supply, temp_return_cons, **kwargs):
+    r"""
+    Starting point of the Newton iteration: minimum norm mass flows for
+    the consumer flows at supply temperature, zero pressure, and the
+    temperatures of these flows.
+    """
+    c = kwargs.get('c', 4190.)
+    E, N = net.n_edges, net.n_nodes
+    Q = np.asarray(Q_node, dtype=float).copy()
+    Q[0] = 0
+    m_cons = Q / (c * max(temp_supply - temp_return_cons, 1.))
+    A_r = net.incidence[1:]
+    m = A_r.T @ spla.spsolve(sp.csc_matrix(A_r @ A_r.T), m_cons[1:])
+    x = np.concatenate([m, np.zeros(N - 1),
+                        np.full(N, float(temp_supply)),
+                        np.full(N, float(temp_return_cons))])
+
+    # supply temperatures for these flows, then return temperatures, each
+    # is linear for given flows and supply temperatures
+    for block in (np.arange(E + N - 1, E + 2*N - 1), np.arange(E + 2*N - 1, E + 3*N - 1)):
+        residual, jacobian = residual_and_jacobian(
+            x, net, Q_node, temp_supply, temp_return_cons, **kwargs)
+        x[block] -= spla.spsolve(jacobian[block][:, block].tocsc(), residual[block])
+    return x
+
+
+def solve_thermohydraulics(net, Q_node, temp_supply, temp_return_cons,
+                           x0=None, method='newton', tol=1e-8, max_iter=20,
+                           preconditioner=None, m_ref=None, **kwargs):
+    r"""
+    Steady state of the coupled hydraulic and thermal network equations.
+
+    Parameters
+    ----------
+    net : CompiledNetwork or networkx MultiDiGraph
+    Q_node : np.array
+        Heat demand at every node [W], the first node is the producer.
+    temp_supply, temp_return_cons : float
+        See residual_and_jacobian.
+    x0 : np.array
+        Starting point, e.g. the solution 'x' of the previous timestep.
+        Default is initial_state, which is also used without demand or
+        if x0 has no flow.
+    method : str
+        'newton' solves every Newton step with a sparse LU factorization,
+        'krylov' with GMRES and an incomplete LU preconditioner, see
+        _gmres_step.
+    tol : float
+        Convergence tolerance on the residual, relative to the largest
+        mass flow (at least m_ref), pressure drop and temperature
+        difference to the ambient.
+    max_iter : int
+        Maximum number of Newton iterations. A warm start that already
+        satisfies tol takes 0 iterations.
+    preconditioner : dict
+        For 'krylov', a dict in which the incomplete LU factorization is
+        kept. It is reused as long as GMRES converges, also in later
+        calls.
+    m_ref : float
+        Reference mass flow [kg/s], e.g. the design flow, as a lower bound
+        of the flow scale of tol. Default is the total consumer flow of
+        Q_node at temp_supply - temp_return_cons. With a small demand and
+        a warm start from a larger one, it keeps the convergence test from
+        shrinking with the flows.
+    **kwargs :
+        Passed to residual_and_jacobian, e.g. temp_amb or c.
+
+    Returns
+    -------
+    state : dict
+        'flows' [kg/s], 'pressure' relative to the producer [Pa],
+        'temp_supply' and 'temp_return' at the nodes [°C], 'heat_loss' of
+        supply and return pipes [W], 'heat_producer' [W], 'iterations' and
+        the state vector 'x'.
+
+    Warns
+    -----
+    RuntimeWarning
+        If the supply temperature at a consumer is less than dT_min above
+        temp_return_cons. Its mass flow is then limited and its demand
+        is not met, usually because of too high heat losses.
+    """
+    if not isinstance(net, CompiledNetwork):
+        net = CompiledNetwork.from_graph(net)
+    E, N = net.n_edges, net.n_nodes
+    c = kwargs.get('c', 4190.)
+    temp_amb = kwargs.get('temp_amb', 10.)
+    dT_min = kwargs.get('dT_min', 1.)
+    Q = np.asarray(Q_node, dtype=float).copy()
+    Q[0] = 0
+    if m_ref is None:
+        m_ref = Q.sum() / (c * max(temp_supply - temp_return_cons, 1.))
+    # a state without flow, e.g. after a timestep without demand, carries
+    # no information about the flow distribution and is a poor start
+    if x0 is None or not Q.any() or not np.any(x0[:E]):
+        x = initial_state(net, Q_node, temp_supply, temp_return_cons, **kwargs)
+    else:
+        x = np.array(x0, dtype=float)
+    if preconditioner is None:
+        preconditioner = {}
+    A_r = net.incidence[1:]
+
+    T_scale = max(abs(temp_supply - temp_amb), 1.)
+    iteration = 0
+    while True:
+        residual, jacobian = residual_and_jacobian(
+            x, net, Q_node, temp_supply, temp_return_cons, **kwargs)
+
+        # residuals relative to the flows and pressure drops in the network
+        m, p_r, T_s, T_r = _split(x, E, N)
+        m_scale = max(np.abs(m).max(), m_ref, 1e-12)
+        p_scale = max(np.abs(A_r.T @ p_r).max(), 1.)
+        scale = np.concatenate([np.full(N - 1, m_scale), np.full(E, p_scale),
+                                np.full(2 * N, m_scale * T_scale)])
+        if np.abs(residual / scale).max() <= tol:
+            break
+        if iteration == max_iter:
+            limited = (Q > 0) & (T_s - temp_return_cons < dT_min)
+            raise RuntimeError('Thermohydraulic solver did not converge within '
+                               '{} iterations, {} consumers below the minimum '
+                               'temperature difference.'
+                               .format(max_iter, limited.sum()))
+
+        if method == 'newton':
+            dx = spla.spsolve(jacobian.tocsc(), -residual)
+        elif method == 'krylov':
+            dx = _gmres_step(jacobian, residual, preconditioner)
+        else:
+            raise ValueError("Unknown method '{}'.".format(method))
+        x += dx
+        iteration += 1
+
+    limited = (Q > 0) & (T_s - temp_return_cons < dT_min)
+    if limited.any():
+        warnings.warn('Supply temperature at {} consumers (lowest {:.1f} °C) is '
+                      'less than dT_min above the return temperature, their '
+                      'demand is not met.'.format(limited.sum(), T_s[limited].min()),
+                      RuntimeWarning)
+
+    w = np.abs(m)
+    a = np.exp(-net.heat_transfer_coefficient * net.length / (c * np.maximum(w, 1e-300)))
+    u = np.where(m >= 0, net.from_idx, net.to_idx)
+    d = np.where(m >= 0, net.to_idx, net.from_idx)
+    heat_loss = c * w * (1 - a) * ((T_s[u] - temp_amb) + (T_r[d] - temp_amb))
+    m_producer = -(net.incidence[0] @ m)[0]
+    return {'flows': m,
+            'pressure': np.concatenate([[0.], p_r]),
+            'temp_supply': T_s,
+            'temp_return': T_r,
+            'heat_loss': heat_loss,
+            'heat_producer': c * m_producer * (T_s[0] - T_r[0]),
+            'iterations': iteration,
+            'x': x}
+
+
+def _gmres_step(jacobian, residual, preconditioner, rtol=1e-10):
+    r"""
+    Newton step with GMRES. The incomplete LU factorization in
+    preconditioner['ilu'] is reused and only recomputed if GMRES does
+    not converge with it. If GMRES does not converge with a fresh
+    factorization either, the step is solved directly.
+    """
+    jacobian = jacobian.tocsc()
+    for refresh in (False, True):
+        if refresh or 'ilu' not in preconditioner:
+            ilu = spla.spilu(jacobian, drop_tol=1e-6, fill_factor=20)
+            preconditioner['ilu'] = spla.LinearOperator(jacobian.shape, ilu.solve)
+        dx, info = spla.gmres(jacobian, -residual, M=preconditioner['ilu'],
+                              rtol=rtol, atol=0., restart=50, maxiter=20)
+        if info == 0:
+            return dx
+    return spla.spsolve(jacobian, -residual)
+
+
+def solve_timeseries(net, Q_node, temp_supply, temp_return_cons,
+                     method='newton', **kwargs):
+    r"""
+    Coupled steady states for a time series, every timestep warm started
+    from the solution of the previous one.
+
+    Parameters
+    ----------
+    net : CompiledNetwork or networkx MultiDiGraph
+    Q_node : np.array
+        Heat demand, nodes x timesteps [W].
+    temp_supply, temp_return_cons : float or np.array
+        Scalar or one value per timestep.
+    method : str
+        See solve_thermohydraulics.
+    **kwargs :
+        Passed to solve_thermohydraulics. m_ref defaults to the largest
+        total consumer flow of all timesteps.
+
+    Returns
+    -------
+    results : dict
+        'flows' (edges x timesteps), 'pressure', 'temp_supply',
+        'temp_return' (nodes x timesteps), 'heat_loss' (edges x
+        timesteps), 'heat_producer' and 'iterations' (timesteps).
+    """
+    if not isinstance(net, CompiledNetwork):
+        net = CompiledNetwork.from_graph(net)
+    Q_node = np.asarray(Q_node, dtype=float)
+    n_steps = Q_node.shape[1]
+    temp_supply = np.broadcast_to(temp_supply, (n_steps,))
+    temp_return_cons = np.broadcast_to(temp_return_cons, (n_steps,))
+    if 'm_ref' not in kwargs:
+        c = kwargs.get('c', 4190.)
+        kwargs['m_ref'] = np.max(Q_node[1:].sum(axis=0) / (
+            c * np.maximum(temp_supply - temp_return_cons, 1.)))
+
+    keys = ['flows', 'pressure', 'temp_supply', 'temp_return', 'heat_loss',
+            'heat_producer', 'iterations']
+    steps = {key: [] for key in keys}
+    x = None
+    preconditioner = {}
+    for t in range(n_steps):
+        state = solve_thermohydraulics(net, Q_node[:, t], temp_supply[t],
+                                       temp_return_cons[t], x0=x,
+                                       method=method,
+                                       preconditioner=preconditioner, **kwargs)
+        x = state['x']
+        for key in keys:
+            steps[key].append(state[key])
+
+    return {key: np.stack(values, axis=-1) for key, values in steps.items()}
@@ -0,0 +1,238 @@
+import numpy as np
+from scipy.sparse.csgraph import depth_first_order
+
+from .friction import lamb_func
+from .network import tree_order
+from .simulation import pressure_drop
+
+
+class TreeIndex:
+    r"""
+    Precomputed index of a tree network for fast subtree and path queries.
+
+    Building the index traverses the tree once. Afterwards
+
+    * subtree sums, e.g. the flow through a pipe, are O(1) per query
+      after one cumulative sum over the node values,
+    * "is node v downstream of pipe e" is O(1) and the nodes downstream
+      of a pipe are a contiguous slice of the depth first order,
+    * sums of edge values along the path between two nodes, e.g. the
+      length, are O(log n) with the lowest common ancestor, and pressure
+      differences are O(1) from the pressure drop towards the root.
+
+    Parameters
+    ----------
+    net : CompiledNetwork
+        Tree network.
+    root : int
+        Positional index of the root node, usually the producer.
+
+    Attributes
+    ----------
+    parent, parent_edge : np.array
+        Parent node and edge of every node, -1 for the root.
+    depth : np.array
+        Number of edges between every node and the root.
+    euler : np.array
+        Nodes in depth first order. The subtree of node v is
+        euler[tin[v]:tout[v]].
+    tin, tout : np.array
+        Start and end of the subtree of every node in euler.
+    orientation : np.array
+        +1 for edges pointing away from the root, -1 otherwise.
+    length_to_root : np.array
+        Pipe length between every node and the root [m].
+    resistance_to_root, pressure_to_root : np.array
+        Hydraulic resistance r = dp / (m |m|) [1/(kg m)] and pressure drop
+        [Pa] between the root and every node, see set_pressure.
+    """
+    def __init__(self, net, root=0):
+        self.net = net
+        self.root = root
+        if root == 0:
+            order, parent, parent_edge = net.tree
+        else:
+            order, parent, parent_edge = tree_order(net.from_idx, net.to_idx,
+                                                    net.n_nodes, root=root)
+        self.order, self.parent, self.parent_edge = order, parent, parent_edge
+        n = net.n_nodes
+
+        # depth, in breadth first order every parent comes before its children
+        depth = [0] * n
+        parent_list = parent.tolist()
+        for node in order[1:].tolist():
+            depth[node] = depth[parent_list[node]] + 1
+        self.depth = np.array(depth)
+        by_depth = order[np.argsort(self.depth[order], kind='stable')]
+        self._levels = np.split(by_depth, np.cumsum(np.bincount(self.depth))[:-1])
+
+        # Euler tour intervals from the depth first order and subtree sizes
+        self.euler = depth_first_order(net.incidence @ net.incidence.T, root,
+                                       directed=False, return_predecessors=False)
+        self.tin = np.empty(n, dtype=np.int64)
+        self.tin[self.euler] = np.arange(n)
+        size = np.ones(n, dtype=np.int64)
+        for nodes in self._levels[:0:-1]:
+            np.add.at(size, parent[nodes], size[nodes])
+        self.tout = self.tin + size
+
+        # edge orientation and the node below every edge
+        children = order[1:]
+        self.child = np.empty(net.n_edges, dtype=np.int64)
+        self.child[parent_edge[children]] = children
+        self.orientation = np.where(net.to_idx == self.child, 1, -1)
+
+        # binary lifting table for the lowest common ancestor
+        n_levels = max(1, int(self.depth.max()).bit_length())
+        up = np.where(parent < 0, root, parent)
+        self._up = [up]
+        for k in range(1, n_levels):
+            self._up.append(self._up[-1][self._up[-1]])
+
+        self.length_to_root = self.root_path_prefix(net.length)
+        self._cumsum = None
+        self.resistance_to_root = None
+        self.pressure_to_root = None
+
+    def root_path_prefix(self, edge_values):
+        r"""
+        Sum of edge values along the path from the root to every node,
+        O(n) once per set of edge values.
+
+        Parameters
+        ----------
+        edge_values : np.array
+            One value per edge, ordered like the edges of the network.
+
+        Returns
+        -------
+        prefix : np.array
+            One value per node, 0 at the root.
+        """
+        edge_values = np.asarray(edge_values, dtype=float)
+        prefix = np.zeros(self.net.n_nodes)
+        for nodes in self._levels[1:]:
+            prefix[nodes] = prefix[self.parent[nodes]] + edge_values[self.parent_edge[nodes]]
+        return prefix
+
+    def lca(self, u, v):
+        r"""
+        Lowest common ancestor of the node arrays u and v, O(log n).
+        """
+        u, v = np.broadcast_arrays(np.array(u, dtype=np.int64), np.array(v, dtype=np.int64))
+        u, v = u.copy(), v.copy()
+        swap = self.depth[u] < self.depth[v]
+        u[swap], v[swap] = v[swap], u[swap]
+        diff = self.depth[u] - self.depth[v]
+        for k, up in enumerate(self._up):
+            lift = (diff >> k) & 1 == 1
+            u[lift] = up[u[lift]]
+        for up in reversed(self._up):
+            differ = up[u] != up[v]
+            u[differ], v[differ] = up[u[differ]], up[v[differ]]
+        return np.where(u == v, u, self._up[0][u])
+
+    def path_sum(self, prefix, u, v):
+        r"""
+        Sum of edge values along the path between nodes u and v, from a
+        prefix of root_path_prefix, O(log n).
+        """
+        w = self.lca(u, v)
+        return prefix[u] + prefix[v] - 2 * prefix[w]
+
+    def path_length(self, u, v):
+        r"""
+        Pipe length between nodes u and v [m].
+        """
+        return self.path_sum(self.length_to_root, u, v)
+
+    def is_ancestor(self, u, v):
+        r"""
+        True where node v is in the subtree of node u, O(1).
+        """
+        u, v = np.asarray(u), np.asarray(v)
+        return (self.tin[u] <= self.tin[v]) & (self.tin[v] < self.tout[u])
+
+    def is_downstream(self, nodes, edge):
+        r"""
+        True where the nodes are on the far side of edge, seen from the
+        root, O(1).
+        """
+        return self.is_ancestor(self.child[edge], nodes)
+
+    def downstream_nodes(self, edge, node_type=None):
+        r"""
+        All nodes on the far side of edge, seen from the root, e.g. all
+        consumers supplied through a pipe with node_type='consumer'. A
+        slice of the depth first order, O(size of the result).
+        """
+        c = self.child[edge]
+        nodes = self.euler[self.tin[c]:self.tout[c]]
+        if node_type is not None:
+            nodes = nodes[self.net.node_type[nodes] == node_type]
+        return nodes
+
+    def set_demand(self, m_node):
+        r"""
+        Store the cumulative node demand in depth first order, O(n), so
+        that subtree_sum and edge_flows are O(1) per query.
+
+        Parameters
+        ----------
+        m_node : np.array
+            Mass flow leaving the network at every node, or nodes x
+            timesteps.
+        """
+        m_node = np.asarray(m_node, dtype=float)
+        self._cumsum = np.concatenate([np.zeros((1,) + m_node.shape[1:]),
+                                       np.cumsum(m_node[self.euler], axis=0)])
+
+    def subtree_sum(self, nodes):
+        r"""
+        Total demand of the subtrees of nodes, see set_demand.
+        """
+        return self._cumsum[self.tout[nodes]] - self._cumsum[self.tin[nodes]]
+
+    def edge_flows(self, edges=None):
+        r"""
+        Mass flows in edges for the demand of set_demand, with the sign of
+        the edge direction like simulation.hydraulics_known_flows_tree.
+        """
+        if edges is None:
+            edges = np.arange(self.net.n_edges)
+        orientation = self.orientation[edges]
+        if self._cumsum.ndim > 1:
+            orientation = orientation[:, np.newaxis]
+        return orientation * self.subtree_sum(self.child[edges])
+
+    def set_pressure(self, m_node, rho=951, mu=0.255e-3,
+                     friction_factor=lamb_func):
+        r"""
+        Set the demand and store the resistance and pressure drop from the
+        root to every node, O(n), so that pressure_difference is O(1) per
+        query.
+
+        Parameters
+        ----------
+        m_node : np.array
+            Mass flow leaving the network at every node.
+        rho, mu, friction_factor :
+            See simulation.pressure_drop.
+        """
+        self.set_demand(m_node)
+        flows = self.edge_flows()
+        dp, _ = pressure_drop(flows, self.net.length, self.net.diameter,
+                              self.net.roughness, rho=rho, mu=mu,
+                              friction_factor=friction_factor)
+        # dp = r m |m|, r is 0 for edges without flow
+        with np.errstate(invalid='ignore', divide='ignore'):
+            resistance = np.where(flows != 0, dp / (flows * np.abs(flows)), 0)
+        self.resistance_to_root = self.root_path_prefix(resistance)
+        self.pressure_to_root = self.root_path_prefix(self.orientation * dp)
+
+    def pressure_difference(self, u, v):
+        r"""
+        Pressure at node u minus pressure at node v [Pa], for the demand of
+        set_pressure, O(1).
+        """
+        return self.pressure_to_root[v] - self.pressure_to_root[u]
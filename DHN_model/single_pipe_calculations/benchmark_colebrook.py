@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from module import friction
+
+# Compare accuracy and speed of the friction factor functions against the
+# Colebrook equation for pipes typical for DHN, n random pipes at once.
+n = 10**6
+repeat = 5
+rng = np.random.RandomState(0)
+Re = 10**rng.uniform(np.log10(2300), 7, n)
+D = rng.uniform(0.02, 1., n)
+eps = 10**rng.uniform(-5, -3, n)
+
+table = friction.ColebrookTable()
+exact = friction.colebrook(eps, D, Re)
+
+methods = {'lamb0': friction.lamb0,
+           'lamb1': friction.lamb1,
+           'lamb2': friction.lamb2,
+           'lamb3': friction.lamb3,
+           'table': table,
+           'colebrook': friction.colebrook}
+
+bench = {'method': [],
+         'max_rel_error': [],
+         'mean_rel_error': [],
+         'ns_per_pipe': []}
+
+for name, function in methods.items():
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        lamb = function(eps, D, Re)
+        times.append(time.perf_counter() - start)
+    rel_error = np.abs(lamb / exact - 1)
+
+    bench['method'].append(name)
+    bench['max_rel_error'].append(rel_error.max())
+    bench['mean_rel_error'].append(rel_error.mean())
+    bench['ns_per_pipe'].append(1e9 * min(times) / n)
+
+bench = pd.DataFrame(bench).set_index('method')
+print(bench)
+print('table max_rel_error on its grid:', table.max_rel_error)
+
+fig, ax = plt.subplots(figsize=(6, 6))
+for name in bench.index:
+    ax.scatter(bench.loc[name, 'ns_per_pipe'], bench.loc[name, 'max_rel_error'],
+               label=name)
+ax.set_yscale('symlog', linthresh=1e-8)
+ax.set_xlabel('time per pipe [ns]')
+ax.set_ylabel('max. relative error')
+ax.legend()
+fig.savefig('benchmark_colebrook.pdf')
@@ -0,0 +1,189 @@
+import numpy as np
+
+
+class Dual(object):
+    r"""
+    Dual number for forward-mode differentiation of array functions.
+
+    Holds the value and its derivatives with respect to n seed inputs.
+    Arithmetic operators and the ufuncs exp, log, sqrt and abs propagate
+    the derivatives, so functions written with them, like
+    single_pipe_vectorized, return exact derivatives in the same call.
+
+    The derivatives are kept per seed in a dict, each broadcastable to the
+    value. Seeds the value does not depend on are left out and the
+    derivatives of scalar seeds stay scalar until they meet an array, so
+    an operation only costs as much as the seeds it actually involves.
+
+    Parameters
+    ----------
+    value : np.array
+
+    columns : dict
+        Derivatives {seed number: array broadcastable to value}.
+
+    n : int
+        Number of seeds.
+    """
+    __array_priority__ = 100
+
+    def __init__(self, value, columns, n):
+        self.value = np.asarray(value, dtype=float)
+        self.columns = columns
+        self.n = n
+
+    @property
+    def shape(self):
+        return self.value.shape
+
+    @property
+    def grad(self):
+        r"""
+        Derivatives as an array of shape value.shape + (n,).
+        """
+        grad = np.zeros(self.value.shape + (self.n,))
+        for i, column in self.columns.items():
+            grad[..., i] = column
+        return grad
+
+    def __repr__(self):
+        return 'Dual({}, {})'.format(self.value, self.grad)
+
+    @staticmethod
+    def _split(other):
+        if isinstance(other, Dual):
+            return other.value, other.columns
+        return np.asarray(other, dtype=float), {}
+
+    def _new(self, value, *terms):
+        return Dual(value, _linear(*terms), self.n)
+
+    def __add__(self, other):
+        value, columns = self._split(other)
+        return self._new(self.value + value, (None, self.columns), (None, columns))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        value, columns = self._split(other)
+        return self._new(self.value - value, (None, self.columns), (-1., columns))
+
+    def __rsub__(self, other):
+        value, columns = self._split(other)
+        return self._new(value - self.value, (None, columns), (-1., self.columns))
+
+    def __mul__(self, other):
+        value, columns = self._split(other)
+        return self._new(self.value * value, (value, self.columns),
+                         (self.value, columns))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        value, columns = self._split(other)
+        inverse = 1 / value
+        quotient = self.value * inverse
+        return self._new(quotient, (inverse, self.columns),
+                         (-quotient * inverse, columns))
+
+    def __rtruediv__(self, other):
+        value, columns = self._split(other)
+        inverse = 1 / self.value
+        quotient = value * inverse
+        return self._new(quotient, (inverse, columns),
+                         (-quotient * inverse, self.columns))
+
+    def __pow__(self, exponent):
+        if isinstance(exponent, Dual):
+            return exp(log(self) * exponent)
+        power = self.value ** exponent
+        return self._new(power, (exponent * power / self.value, self.columns))
+
+    def __rpow__(self, base):
+        return exp(np.log(base) * self)
+
+    def __neg__(self):
+        return self._new(-self.value, (-1., self.columns))
+
+    def __abs__(self):
+        return self._new(np.abs(self.value), (np.sign(self.value), self.columns))
+
+    def __gt__(self, other):
+        return self.value > self._split(other)[0]
+
+    def __lt__(self, other):
+        return self.value < self._split(other)[0]
+
+    def __ge__(self, other):
+        return self.value >= self._split(other)[0]
+
+    def __le__(self, other):
+        return self.value <= self._split(other)[0]
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method != '__call__' or kwargs:
+            return NotImplemented
+        if ufunc in _binary:
+            a, b = inputs
+            if isinstance(a, Dual):
+                return getattr(a, _binary[ufunc])(b)
+            return getattr(b, '__r' + _binary[ufunc][2:])(a)
+        if ufunc in _unary:
+            return _unary[ufunc](inputs[0])
+        return NotImplemented
+
+
+def _linear(*terms):
+    r"""
+    Sum of factor * columns over the (factor, columns) terms, per seed. A
+    factor of None is 1.
+    """
+    result = {}
+    for factor, columns in terms:
+        for i, column in columns.items():
+            if factor is not None:
+                column = factor * column
+            result[i] = result[i] + column if i in result else column
+    return result
+
+
+def exp(x):
+    value = np.exp(x.value)
+    return x._new(value, (value, x.columns))
+
+
+def log(x):
+    return x._new(np.log(x.value), (1 / x.value, x.columns))
+
+
+def sqrt(x):
+    value = np.sqrt(x.value)
+    return x._new(value, (0.5 / value, x.columns))
+
+
+_binary = {np.add: '__add__',
+           np.subtract: '__sub__',
+           np.multiply: '__mul__',
+           np.true_divide: '__truediv__',
+           np.power: '__pow__'}
+
+_unary = {np.exp: exp,
+          np.log: log,
+          np.sqrt: sqrt,
+          np.negative: Dual.__neg__,
+          np.absolute: Dual.__abs__}
+
+
+def seed(*args):
+    r"""
+    Dual numbers of the arguments, each with the unit derivative with
+    respect to itself. The arguments are not broadcast, this happens in
+    the arithmetic.
+
+    Returns
+    -------
+    list of Dual
+        Derivatives with respect to len(args) seeds.
+    """
+    n = len(args)
+    return [Dual(a, {i: 1.}, n) for i, a in enumerate(args)]
@@ -0,0 +1,231 @@
+import os.path
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from single_pipe_calculations import single_pipe_vectorized, result_dict
+
+
+class StreamingStats(object):
+    r"""
+    Streaming statistics of several outputs with constant memory.
+
+    Mean and variance are merged batch by batch (Welford/Chan), quantiles
+    and histograms come from fixed bins per output. The bin range is set
+    from the first batch, widened by margin on both sides. Values outside
+    are counted as under- and overflow and only shift the quantiles if
+    they fall into the tails.
+
+    NaN values are not counted.
+
+    Parameters
+    ----------
+    names : list
+        Names of the outputs.
+
+    bins : int
+        Number of histogram bins per output.
+
+    margin : float
+        Widening of the bin range relative to the range of the first
+        batch.
+    """
+    def __init__(self, names, bins=2000, margin=0.5):
+        self.names = list(names)
+        n = len(self.names)
+        self.bins = bins
+        self.margin = margin
+        self.count = np.zeros(n, dtype=np.int64)
+        self.mean = np.zeros(n)
+        self.m2 = np.zeros(n)
+        self.min = np.full(n, np.inf)
+        self.max = np.full(n, -np.inf)
+        self.edges = None
+        self.counts = np.zeros((n, bins + 2), dtype=np.int64)
+
+    def update(self, values):
+        r"""
+        Add a batch of values of shape (samples, outputs).
+        """
+        valid = ~np.isnan(values)
+        n_b = valid.sum(axis=0)
+        filled = np.where(valid, values, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_b = np.where(n_b > 0, filled.sum(axis=0) / n_b, 0)
+            m2_b = (np.where(valid, values - mean_b, 0)**2).sum(axis=0)
+            n = self.count + n_b
+            delta = mean_b - self.mean
+            self.mean = np.where(n > 0, self.mean + delta * n_b / n, 0)
+            self.m2 = np.where(n > 0, self.m2 + m2_b + delta**2 * self.count * n_b / n, 0)
+        self.count = n
+        self.min = np.fmin(self.min, np.nanmin(np.where(valid, values, np.inf), axis=0))
+        self.max = np.fmax(self.max, np.nanmax(np.where(valid, values, -np.inf), axis=0))
+
+        if self.edges is None:
+            lower, upper = self.min.copy(), self.max.copy()
+            span = np.where(upper > lower, upper - lower, np.abs(upper) + 1)
+            lower[~np.isfinite(lower)], span[~np.isfinite(span)] = 0, 1
+            lower, upper = lower - self.margin * span, lower + (1 + self.margin) * span
+            self.edges = np.linspace(lower, upper, self.bins + 1, axis=-1)
+
+        # bin 0 is underflow, bin bins + 1 overflow
+        width = (self.edges[:, -1] - self.edges[:, 0]) / self.bins
+        index = np.floor((values - self.edges[:, 0]) / width) + 1
+        index = np.clip(np.nan_to_num(index, nan=-1), -1, self.bins + 1).astype(np.int64)
+        offset = np.arange(len(self.names)) * (self.bins + 2)
+        flat = (index + offset)[valid]
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape)
+
+    @property
+    def var(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+
+    def ci_halfwidth(self, confidence=0.95):
+        r"""
+        Half width of the confidence interval of the mean.
+        """
+        z = stats.norm.ppf(0.5 + confidence / 2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return z * np.sqrt(self.var / self.count)
+
+    def quantiles(self, q):
+        r"""
+        Quantiles interpolated linearly in the bins, of shape
+        (len(q), outputs). Quantiles in the under- or overflow are
+        clipped to the observed minimum and maximum.
+        """
+        q = np.atleast_1d(q)
+        result = np.full((len(q), len(self.names)), np.nan)
+        if self.edges is None:
+            return result
+        for i in range(len(self.names)):
+            if self.count[i] == 0:
+                continue
+            # cumulative counts at the bin edges, including under/overflow
+            edges = np.concatenate([[self.min[i]], self.edges[i], [self.max[i]]])
+            edges = np.maximum.accumulate(np.clip(edges, self.min[i], self.max[i]))
+            cumulative = np.concatenate([[0], np.cumsum(self.counts[i])]) / self.count[i]
+            result[:, i] = np.interp(q, cumulative, edges)
+        return result
+
+    def histogram(self, name):
+        r"""
+        Counts and bin edges of one output, without under- and overflow.
+        """
+        i = self.names.index(name)
+        return self.counts[i, 1:-1], self.edges[i]
+
+    def summary(self, quantiles=(0.05, 0.5, 0.95), confidence=0.95):
+        r"""
+        Table with count, mean, std, confidence interval of the mean,
+        quantiles and the fraction out of the histogram range per output.
+        """
+        table = pd.DataFrame({'count': self.count,
+                              'mean': self.mean,
+                              'std': np.sqrt(self.var),
+                              'ci_halfwidth': self.ci_halfwidth(confidence),
+                              'min': self.min,
+                              'max': self.max},
+                             index=self.names)
+        for q, values in zip(quantiles, self.quantiles(quantiles)):
+            table['q{:g}'.format(q)] = values
+        with np.errstate(invalid='ignore', divide='ignore'):
+            table['out_of_range'] = (self.counts[:, 0] + self.counts[:, -1]) / self.count
+        return table
+
+
+def _draw(distribution, size, rng):
+    if hasattr(distribution, 'rvs'):
+        return distribution.rvs(size=size, random_state=rng)
+    return distribution(rng, size)
+
+
+def monte_carlo(distributions, fixed, function=single_pipe_vectorized,
+                names=result_dict['results'], batch_size=100000,
+                max_samples=10**7, rtol=None, atol=None, confidence=0.95,
+                seed=None, bins=2000):
+    r"""
+    Monte Carlo uncertainty propagation through a vectorized function
+    with streaming statistics.
+
+    Inputs are drawn in batches of batch_size, the function is evaluated
+    for the whole batch in one call and only the streaming statistics of
+    its outputs are kept, so memory does not grow with the number of
+    samples. Sampling stops after max_samples, or earlier once the
+    confidence interval of the mean of every output is narrower than
+    rtol * |mean| or atol.
+
+    Parameters
+    ----------
+    distributions : dict
+        Uncertain inputs. A scipy.stats frozen distribution or a callable
+        distribution(rng, size) per input.
+
+    fixed : dict
+        Inputs with fixed values.
+
+    function : function
+        Vectorized function taking the inputs as keyword arguments and
+        returning outputs in a last axis, like single_pipe_vectorized.
+
+    names : list
+        Names of the outputs.
+
+    batch_size : int
+
+    max_samples : int
+
+    rtol, atol : float
+        Target half width of the confidence interval of the means, relative
+        and absolute. No early stop if both are None.
+
+    confidence : float
+        Confidence level of the interval.
+
+    seed : int
+
+    bins : int
+        See StreamingStats.
+
+    Returns
+    -------
+    stats : StreamingStats
+        With the number of drawn samples in n_samples.
+    """
+    rng = np.random.RandomState(seed)
+    streaming_stats = StreamingStats(names, bins=bins)
+    n_samples = 0
+    while n_samples < max_samples:
+        size = min(batch_size, max_samples - n_samples)
+        drawn = {name: _draw(d, size, rng) for name, d in distributions.items()}
+        values = np.asarray(function(**drawn, **fixed))
+        streaming_stats.update(values.reshape(size, -1))
+        n_samples += size
+
+        if rtol is not None or atol is not None:
+            halfwidth = streaming_stats.ci_halfwidth(confidence)
+            target = np.zeros(len(names))
+            if rtol is not None:
+                target = target + rtol * np.abs(streaming_stats.mean)
+            if atol is not None:
+                target = target + atol
+            if np.all(halfwidth <= target):
+                break
+
+    streaming_stats.n_samples = n_samples
+    return streaming_stats
+
+
+if __name__ == '__main__':
+    distributions = {'k': stats.uniform(1, 2),
+                     'eps': stats.lognorm(0.5, scale=0.01e-3),
+                     'mu': stats.norm(0.255e-3, 0.01e-3),
+                     'DT_prod_in': stats.norm(90, 5)}
+    fixed = {'Q_cons': 3, 'DT_drop': 10, 'L': 1000, 'D': 0.25, 'c': 4230, 'rho': 951}
+    mc_stats = monte_carlo(distributions, fixed, rtol=1e-3, seed=0)
+    print('{} samples'.format(mc_stats.n_samples))
+    print(mc_stats.summary())
@@ -4,28 +4,50 @@ import numpy as np
 from collections import OrderedDict
 import xarray as xr
 import os.path
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'sensitivity_analysis'))
+from generic_sampling import generic_sampling, grid_sampling
+from sampling_cache import cached_sampling
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import dual
 
 lamb_func = lambda eps, D, Re: 1.325 / (np.log(eps/(3.7*D) + 5.74/(Re**0.9)))**2
 
 def single_pipe(args):
     r"""
-    
-    
+    Outputs of a single pair of supply and return pipes for one sample
+    (Q_cons, DT_drop, DT_prod_in, k, L, D, c, rho, eps, mu), ordered like
+    result_dict, or None if DT_prod_r <= 0.
+    """
+    outputs = _single_pipe_outputs(*args)
+    if outputs[2] > 0:
+        return np.array(outputs)
+    else:
+        return None
+
+
+def _single_pipe_outputs(Q_cons, DT_drop, DT_prod_in, k, L, D, c, rho, eps, mu):
+    r"""
+    Outputs of single_pipe, ordered like result_dict. Written with
+    arithmetic operators, np.exp and np.log only, so that it evaluates
+    arrays as well as dual numbers.
     """
-    Q_cons, DT_drop, DT_prod_in, k, L, D, c, rho, eps, mu = args
-    Q_cons *= 1e6 # MW to W
+    Q_cons = 1e6 * Q_cons # MW to W
     eta_pump = 0.7
     pressure_loss_cons = 1e6
-    
+
     # hydraulic part
     # mass flow is determined by consumer mass flow
     m = Q_cons * 1 /(c*DT_drop)
-    
+
     # pressure loss
     v = 4*m / (rho * np.pi * D**2)
     Re = D * v * rho / mu
     lamb = lamb_func(eps, D, Re)
-    
+
     pressure_loss = lamb * 8*L * 1/(rho*np.pi**2*D**5) * m**2
     Dp_pump = 2 * pressure_loss + pressure_loss_cons
     P_pump = Dp_pump * m * 1/rho
@@ -34,65 +56,71 @@ def single_pipe(args):
     exponent = k * np.pi * L * D * 1/(c*m)
     DT_cons_in = DT_prod_in * np.exp(-1*exponent)
     DT_prod_r = (DT_cons_in - DT_drop) *  np.exp(-1*exponent)
-    
+
     Q_prod = c * m * (DT_prod_in - DT_prod_r)
     Q_loss = Q_prod - Q_cons
     perc_loss = 100 * Q_loss * 1/Q_prod
-    
+
     # Change units
     pressure_loss_bar = 1e-5 * pressure_loss
     P_pump_kW = 1e-3 *1/eta_pump * P_pump
     Q_loss_MW = 1e-6 * Q_loss
 
-    
-    if DT_prod_r > 0:
-        return np.array([Q_prod, DT_cons_in, DT_prod_r, v, 
-                         pressure_loss_bar, P_pump_kW, Q_loss_MW, perc_loss])
-    else:
-        return None
+    return (Q_prod, DT_cons_in, DT_prod_r, v,
+            pressure_loss_bar, P_pump_kW, Q_loss_MW, perc_loss)
+
+
+def single_pipe_vectorized(Q_cons, DT_drop, DT_prod_in, k, L, D, c, rho, eps, mu):
+    r"""
+    Array version of single_pipe.
+
+    All inputs are broadcast against each other, so that a whole
+    parameter grid is evaluated in one call. The inputs are not modified.
+
+    Returns
+    -------
+    results : np.array
+        Array of the broadcast input shape with a last axis of length 8,
+        ordered like result_dict. Points with DT_prod_r <= 0 are NaN.
+    """
+    outputs = np.broadcast_arrays(*_single_pipe_outputs(
+        np.asarray(Q_cons, dtype=float), DT_drop, DT_prod_in, k, L, D, c, rho, eps, mu))
+    results = np.stack(outputs, axis=-1)
+    results[~(outputs[2] > 0)] = np.nan
+    return results
 
 
-def generic_sampling(input_dict, results_dict, function):
+def single_pipe_gradient(Q_cons, DT_drop, DT_prod_in, k, L, D, c, rho, eps, mu):
     r"""
-    n-dimensional full sampling, storing as xarray.
-    
-    Parameters
-    ----------
-    input_dict : OrderedDict
-        Ordered dictionary containing the ranges of the
-        dimensions.
-    
-    results_dict : OrderedDict
-        Ordered dictionary containing the dimensions and 
-        coordinates of the results of the function.
-        
-    function : function
-        Function to be sampled.
-    
+    single_pipe_vectorized with exact derivatives of every output with
+    respect to every input, computed in the same call by forward-mode
+    differentiation with dual numbers.
+
+    Derivatives are with respect to the inputs in their units, e.g.
+    dP_pump [kW] / dD [m] or dQ_loss [MW] / dk [W/(m²K)].
+
     Returns
     -------
-    results : xarray.DataArray
-    
-    sampling : np.array
-    
-    indices : 
+    results : np.array
+        See single_pipe_vectorized.
+
+    gradients : np.array
+        Array of the broadcast input shape with two last axes of length 8
+        (outputs, ordered like result_dict) and 10 (inputs, ordered like
+        input_dict). NaN where the results are NaN.
     """
-    import itertools as it
-    join_dicts = OrderedDict(list(input_dict.items()) + list(results_dict.items()))
-    dims = join_dicts.keys()
-    coords = join_dicts.values()
-    results = xr.DataArray(np.empty([len(v) for v in join_dicts.values()]),
-                           dims=dims,
-                           coords=coords)
-
-    sampling = np.array(list(it.product(*input_dict.values())))
-    indices = np.array(list(it.product(*[np.arange(len(v)) for v in input_dict.values()])))
-    
-    for i in range(len(sampling)):
-        result = function(sampling[i])
-        results[tuple(indices[i])] = result
-        
-    return results, sampling, indices
+    outputs = _single_pipe_outputs(*dual.seed(Q_cons, DT_drop, DT_prod_in, k, L,
+                                              D, c, rho, eps, mu))
+    values = np.broadcast_arrays(*[o.value for o in outputs])
+    results = np.stack(values, axis=-1)
+    gradients = np.zeros(results.shape + (outputs[0].n,))
+    for j, o in enumerate(outputs):
+        for i, column in o.columns.items():
+            gradients[..., j, i] = column
+    invalid = ~(values[2] > 0)
+    results[invalid] = np.nan
+    gradients[invalid] = np.nan
+    return results, gradients
 
 
 input_dict = OrderedDict([('Q_cons', np.arange(1, 6, 0.2)),
@@ -184,15 +212,11 @@ def plot_data():
     # plt.tight_layout()
     fig.savefig('single_pipe_calculations.pdf', bbox_inches="tight")
 
-if os.path.isfile('single_pipe_calculations.nc') :
-    print('File exists')
-    sam_results = xr.open_dataarray('single_pipe_calculations.nc')
-else:
-    print('Calculate')
-    sam_results = generic_sampling(input_dict, result_dict,
-                              single_pipe)[0]
-    sam_results.to_netcdf('single_pipe_calculations.nc')
-
-
+if __name__ == '__main__':
+    # only grid points that are not cached for the current source of this
+    # module are computed
+    sam_results = cached_sampling(input_dict, result_dict, single_pipe_vectorized,
+                                  vectorized=True)
+    print('Calculated {} samples'.format(sam_results.attrs['n_computed']))
 
-plot_data()
\ No newline at end of file
+    plot_data()
@@ -0,0 +1,146 @@
+r"""
+Multinode model of a stratified thermal energy storage.
+
+The tank is split into n_layers horizontal layers of equal volume, layer 0
+is at the top. Every layer exchanges heat with its neighbours by
+conduction, with the ambient through its share of the wall and, for the
+top and bottom layer, through the lids. Charging flow enters at the top
+and leaves at the bottom, discharging flow the other way round
+(upwind). The layer temperatures are advanced with the implicit Euler
+method, so every timestep is one tridiagonal solve and the timestep is not
+limited by stability.
+
+In contrast to the loss models in tes_losses.py, SI units are used here:
+[m], [kg/s], [J/(kg K)], [W/(m2 K)], [W] and temperatures in [°C].
+"""
+import numpy as np
+from scipy.linalg import lapack
+
+
+class StratifiedTank(object):
+    r"""
+    Cylindrical tank with n_layers fully mixed layers.
+
+    Parameters
+    ----------
+    volume : float
+        Volume [m3]
+    h : float
+        Height [m]
+    n_layers : int
+        Number of layers.
+    U : float
+        Heat transfer coefficient of wall and lids [W/(m2 K)]
+    k_eff : float
+        Effective vertical thermal conductivity [W/(m K)], including
+        mixing between the layers.
+    c : float
+        Specific heat capacity [J/(kg K)]
+    rho : float
+        Density [kg/m3]
+    """
+    def __init__(self, volume, h, n_layers=100, U=0.5, k_eff=0.6,
+                 c=4190., rho=1000.):
+        self.volume = volume
+        self.h = h
+        self.n_layers = n_layers
+        self.c = c
+        self.rho = rho
+
+        base = volume / h
+        r = np.sqrt(base / np.pi)
+        dz = h / n_layers
+        self.layer_capacity = rho * c * base * dz
+
+        # conductance between neighbouring layers and to the ambient [W/K]
+        self.G_layers = k_eff * base / dz
+        self.UA = np.full(n_layers, U * 2 * np.pi * r * dz)
+        self.UA[0] += U * base
+        self.UA[-1] += U * base
+
+        self._factorizations = {}
+
+    def _factorize(self, dt, m_charge, m_discharge):
+        r"""
+        LU factorization of the implicit Euler matrix. It only depends on
+        the timestep and the flows, so it is cached for them.
+        """
+        key = (dt, m_charge, m_discharge)
+        if key not in self._factorizations:
+            n = self.n_layers
+            G = np.full(n - 1, self.G_layers)
+            diag = self.layer_capacity / dt + self.UA \
+                + self.c * (m_charge + m_discharge)
+            diag[:-1] += G
+            diag[1:] += G
+            lower = -G - self.c * m_charge
+            upper = -G - self.c * m_discharge
+            dl, d, du, du2, ipiv, info = lapack.dgttrf(lower, diag, upper)
+            if info != 0:
+                raise np.linalg.LinAlgError('Tank matrix is singular.')
+            if len(self._factorizations) > 1000:
+                self._factorizations.clear()
+            self._factorizations[key] = (dl, d, du, du2, ipiv)
+        return self._factorizations[key]
+
+    def simulate(self, temp_init, m_charge=0., m_discharge=0., temp_charge=90.,
+                 temp_return=50., temp_amb=10., n_steps=None, dt=3600.):
+        r"""
+        Layer temperatures and losses over time.
+
+        All time dependent inputs are scalars or arrays of length n_steps.
+        The matrix is factorized once for every distinct combination of
+        charging and discharging flow, so that a constant or piecewise
+        constant operation reuses it.
+
+        Parameters
+        ----------
+        temp_init : float or np.array
+            Initial temperature of all layers or of every layer, top first.
+        m_charge : float or np.array
+            Charging mass flow [kg/s], entering at the top.
+        m_discharge : float or np.array
+            Discharging mass flow [kg/s], entering at the bottom.
+        temp_charge : float or np.array
+            Temperature of the charging flow at the top inlet.
+        temp_return : float or np.array
+            Temperature of the discharging flow at the bottom inlet.
+        temp_amb : float or np.array
+            Ambient temperature.
+        n_steps : int
+            Number of timesteps, default the length of the time series.
+        dt : float
+            Timestep [s]
+
+        Returns
+        -------
+        temp : np.array
+            Layer temperatures at the end of every timestep, n_steps x
+            n_layers.
+        loss : np.array
+            Heat loss to the ambient in every timestep [W].
+        """
+        series = [m_charge, m_discharge, temp_charge, temp_return, temp_amb]
+        if n_steps is None:
+            n_steps = max(np.size(s) for s in series)
+        m_charge, m_discharge, temp_charge, temp_return, temp_amb = [
+            np.broadcast_to(np.asarray(s, dtype=float), (n_steps,)) for s in series]
+
+        temp = np.empty((n_steps, self.n_layers))
+        current = np.broadcast_to(np.asarray(temp_init, dtype=float),
+                                  (self.n_layers,)).copy()
+        storage = self.layer_capacity / dt
+        UA = self.UA
+        b = np.empty(self.n_layers)
+
+        for t in range(n_steps):
+            dl, d, du, du2, ipiv = self._factorize(dt, m_charge[t], m_discharge[t])
+            np.multiply(storage, current, out=b)
+            b += UA * temp_amb[t]
+            b[0] += self.c * m_charge[t] * temp_charge[t]
+            b[-1] += self.c * m_discharge[t] * temp_return[t]
+            current, info = lapack.dgttrs(dl, d, du, du2, ipiv, b)
+            temp[t] = current
+
+        loss = (temp - temp_amb[:, np.newaxis]) @ UA
+        return temp, loss
@@ -0,0 +1,191 @@
+r"""
+Vectorized heat loss models of thermal energy storages, based on the
+loss models in TES_model_sketches.ipynb.
+
+The tank geometry is computed once per tank. All losses are affine in the
+state of charge, loss = fixed_loss + loss_slope * soc, so that whole SOC
+time series of many tank designs are evaluated in one array operation.
+
+Units follow the sketches: capacity [kWh], c [kWh/(kg K)], U [kW/(m2 K)],
+temperatures [°C], soc [%] and losses [kW].
+"""
+import os.path
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'sensitivity_analysis'))
+from generic_sampling import grid_sampling
+
+
+def tank_geometry(cap, h, c, rho, temp_max, temp_amb):
+    r"""
+    Geometry of a cylindrical tank of fixed height holding cap between
+    temp_amb and temp_max.
+
+    Returns
+    -------
+    geometry : dict
+        'r' radius, 'base' area of top and bottom each (pi r^2), 'lateral'
+        area of the side wall and 'A' total area, broadcast over the
+        inputs.
+    """
+    base = cap * 1/(h*c*rho*(temp_max - temp_amb))
+    r = np.sqrt(base / np.pi)
+    lateral = 2 * np.pi * r * h
+    return {'r': r, 'base': base, 'lateral': lateral, 'A': 2 * base + lateral}
+
+
+def _affine_mixed(geometry, U, temp_min, temp_max, temp_amb):
+    UA = U * geometry['A']
+    return UA * (temp_min - temp_amb), UA * 0.01 * (temp_max - temp_min)
+
+
+def _affine_stratified(geometry, U, temp_min, temp_max, temp_amb):
+    # boundary at x = h (1 - soc), the lateral area above it is hot
+    base, lateral = geometry['base'], geometry['lateral']
+    fixed_loss = U * (temp_max - temp_amb) * base + U * (temp_min - temp_amb) * (base + lateral)
+    loss_slope = U * 0.01 * lateral * (temp_max - temp_min)
+    return fixed_loss, loss_slope
+
+
+class StorageTank(object):
+    r"""
+    Heat losses of one or many storage tanks.
+
+    All parameters are broadcast against each other, so that an array of
+    tank designs is described by one StorageTank. The geometry and the
+    loss coefficients are computed once.
+
+    Parameters
+    ----------
+    cap : float or np.array
+        Capacity [kWh]
+    U : float or np.array
+        Heat transfer coefficient [kW/(m2 K)]
+    temp_min, temp_max, temp_amb : float or np.array
+        Temperatures of the cold and hot water and of the ambient [°C]
+    h : float or np.array
+        Height [m]
+    c : float or np.array
+        Specific heat capacity [kWh/(kg K)]
+    rho : float or np.array
+        Density [kg/m3]
+    model : str
+        'mixed' for the fully mixed model or 'stratified' for the fully
+        stratified model.
+    """
+    def __init__(self, cap, U=0.005, temp_min=65, temp_max=90, temp_amb=21,
+                 h=2, c=0.00117, rho=1000, model='mixed'):
+        args = np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in
+                                     (cap, U, temp_min, temp_max, temp_amb, h, c, rho)])
+        cap, U, temp_min, temp_max, temp_amb, h, c, rho = args
+        self.cap = cap
+        self.shape = cap.shape
+        self.geometry = tank_geometry(cap, h, c, rho, temp_max, temp_amb)
+        if model == 'mixed':
+            affine = _affine_mixed
+        elif model == 'stratified':
+            affine = _affine_stratified
+        else:
+            raise ValueError("Unknown model '{}'.".format(model))
+        self.model = model
+        self.fixed_loss, self.loss_slope = affine(self.geometry, U, temp_min,
+                                                  temp_max, temp_amb)
+
+    def loss(self, soc):
+        r"""
+        Heat loss [kW] for a state of charge [%].
+
+        Parameters
+        ----------
+        soc : float or np.array
+            State of charge, e.g. a time series of 8760 values.
+
+        Returns
+        -------
+        loss : np.array
+            Of shape tank shape + soc shape.
+        """
+        soc = np.asarray(soc, dtype=float)
+        expand = (Ellipsis,) + (np.newaxis,) * soc.ndim
+        return self.fixed_loss[expand] + self.loss_slope[expand] * soc
+
+    def energy_loss(self, soc, dt=1.):
+        r"""
+        Total heat loss [kWh] of SOC time series in the last axis of soc,
+        with timesteps of dt hours.
+        """
+        soc = np.asarray(soc, dtype=float)
+        expand = (Ellipsis,) + (np.newaxis,) * (soc.ndim - 1)
+        return dt * (soc.shape[-1] * self.fixed_loss[expand]
+                     + self.loss_slope[expand] * soc.sum(axis=-1))
+
+    def generic_storage_parameters(self):
+        r"""
+        Loss parameters of an oemof.solph GenericStorage with the capacity
+        of the tank.
+
+        Per hour, the storage loses loss_rate times the stored energy plus
+        fixed_losses_absolute. solph scales both with the timeincrement
+        itself, so they are given per hour for any timestep. Older solph
+        versions only know the relative part, as capacity_loss.
+
+        Returns
+        -------
+        dict
+            'nominal_storage_capacity' [kWh], 'loss_rate' [1/h],
+            'fixed_losses_absolute' [kW] and 'capacity_loss'
+            (= loss_rate), shaped like the tanks.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            loss_rate = np.where(self.cap > 0, 100 * self.loss_slope / self.cap, 0)
+        return {'nominal_storage_capacity': self.cap,
+                'loss_rate': loss_rate,
+                'fixed_losses_absolute': self.fixed_loss,
+                'capacity_loss': loss_rate}
+
+
+def capacity_model(loss_rate, cap, soc):
+    r"""
+    Losses as a percentage of the stored energy, broadcast over the
+    inputs.
+    """
+    return cap * 0.01 * np.asarray(soc) * loss_rate
+
+
+def steen_model(storage_loss_rate, static_loss_rate,
+                temp_min, temp_max, temp_amb, cap, soc):
+    r"""
+    Losses of the stored energy plus static losses of the unusable
+    energy below temp_min, broadcast over the inputs.
+    """
+    e_unuse = cap * (temp_min - temp_amb) * 1/(temp_max - temp_min)
+    return cap * 0.01 * np.asarray(soc) * storage_loss_rate + e_unuse * static_loss_rate
+
+
+def loss_lookup(input_dict, model='mixed'):
+    r"""
+    Losses on the full grid of input_dict in one array call, in the format
+    of generic_sampling.
+
+    Parameters
+    ----------
+    input_dict : OrderedDict
+        Ranges of the parameters of StorageTank and of 'soc'.
+    model : str
+        See StorageTank.
+
+    Returns
+    -------
+    results : xarray.DataArray
+        With the input dimensions and a dimension 'results' = ['loss'].
+    """
+    def loss(soc, **kwargs):
+        # soc is on its own grid axis, so it broadcasts with the tank shape
+        tank = StorageTank(model=model, **kwargs)
+        return (tank.fixed_loss + tank.loss_slope * soc)[..., np.newaxis]
+
+    return grid_sampling(input_dict, OrderedDict([('results', ['loss'])]), loss)
@@ -13,6 +13,12 @@ import pyomo.environ as po
 import time
 import itertools as it
 from collections import OrderedDict
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'sensitivity_analysis'))
+from generic_sampling import generic_sampling
 solver = 'cbc'
 
 color_dict ={
@@ -111,50 +117,6 @@ def run_basic_energysystem(args):
     return el_prod
 
 
-def generic_sampling(input_dict, results_dict, function):
-    r"""
-    n-dimensional full sampling, storing as xarray.
-    
-    Parameters
-    ----------
-    input_dict : OrderedDict
-        Ordered dictionary containing the ranges of the
-        dimensions.
-    
-    results_dict : OrderedDict
-        Ordered dictionary containing the dimensions and 
-        coordinates of the results of the function.
-        
-    function : function
-        Function to be sampled.
-    
-    Returns
-    -------
-    results : xarray.DataArray
-    
-    sampling : np.array
-    
-    indices : 
-    """
-    import itertools as it
-    join_dicts = OrderedDict(list(input_dict.items()) + list(results_dict.items()))
-    dims = join_dicts.keys()
-    coords = join_dicts.values()
-    results = xr.DataArray(np.empty([len(v) for v in join_dicts.values()]),
-                           dims=dims,
-                           coords=coords)
-
-    sampling = np.array(list(it.product(*input_dict.values())))
-    indices = np.array(list(it.product(*[np.arange(len(v)) for v in input_dict.values()])))
-    
-    for i in range(len(sampling)):
-        print(sampling[i])
-        result = function(sampling[i])
-        results[tuple(indices[i])] = result
-        
-    return results, sampling, indices
-
-
 def xarray_to_interactive_dispatch_plot(results, tune, producer, time):
     """
     Creates a tunable dispatch plot from an xarray.
@@ -194,13 +156,15 @@ def xarray_to_interactive_dispatch_plot(results, tune, producer, time):
     renderer.save(dispatch_hmap, 'example_sampling_and_plotting')
     
 
-input_dict = {'n_vals_wind': [30, 50, 70],
-              'n_vals_solar': [30, 50]}
-results_dict = {'times': datetimeindex,
-                'producer': [0,1,2,3,4]}
-data_dispatch_2 = generic_sampling(input_dict, results_dict, run_basic_energysystem)[0]
-
-tune = ['n_vals_wind', 'n_vals_solar']
-producer = 'producer'
-times = 'times'
-xarray_to_interactive_dispatch_plot(data_dispatch_2, tune, producer, times)
+if __name__ == '__main__':
+    input_dict = {'n_vals_wind': [30, 50, 70],
+                  'n_vals_solar': [30, 50]}
+    results_dict = {'times': datetimeindex,
+                    'producer': [0,1,2,3,4]}
+    data_dispatch_2 = generic_sampling(input_dict, results_dict, run_basic_energysystem,
+                                       processes=None, progress=True)[0]
+
+    tune = ['n_vals_wind', 'n_vals_solar']
+    producer = 'producer'
+    times = 'times'
+    xarray_to_interactive_dispatch_plot(data_dispatch_2, tune, producer, times)
@@ -0,0 +1,414 @@
+import hashlib
+import inspect
+import itertools as it
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+
+
+def _evaluate_chunk(function, samples, result_shape, unpack):
+    r"""
+    Evaluate function for a chunk of samples. Samples for which the
+    function returns None are filled with NaN.
+    """
+    results = np.full((len(samples),) + tuple(result_shape), np.nan)
+    for i, sample in enumerate(samples):
+        result = function(*sample) if unpack else function(sample)
+        if result is not None:
+            results[i] = np.asarray(result, dtype=float)
+    return results
+
+
+def _evaluate_chunk_star(args):
+    start, stop, chunk_args = args
+    return start, stop, _evaluate_chunk(*chunk_args)
+
+
+def _chunk_samples(input_values, start, stop):
+    r"""
+    Samples number start to stop of the Cartesian product of the input
+    values, in the order of it.product, without building the product.
+    """
+    shape = [len(v) for v in input_values]
+    indices = np.unravel_index(np.arange(start, stop), shape)
+    return np.column_stack([np.asarray(v)[i] for v, i in zip(input_values, indices)])
+
+
+def _evaluate_lazy_chunk_star(args):
+    start, stop, (function, input_values, result_shape, unpack) = args
+    samples = _chunk_samples(input_values, start, stop)
+    return start, stop, _evaluate_chunk(function, samples, result_shape, unpack)
+
+
+def _update_hash(h, dims_and_coords):
+    for dim, coords in dims_and_coords.items():
+        coords = np.asarray(coords)
+        h.update(str(dim).encode())
+        if coords.dtype.kind in 'biufcmM':
+            h.update(coords.dtype.str.encode())
+            h.update(np.ascontiguousarray(coords).tobytes())
+        else:
+            h.update(repr(coords.tolist()).encode())
+
+
+def function_key(function, results_dict, version=None):
+    r"""
+    Hash of the source of the module defining the function, the function
+    name, an optional version and the result dimensions.
+
+    The whole module is hashed, so that a change to a helper defined next
+    to the function, e.g. lamb_func for single_pipe_vectorized, invalidates
+    the cache. If the function depends on code in other modules that
+    changes, pass a new version.
+    """
+    name = getattr(function, '__qualname__', repr(function))
+    try:
+        source = inspect.getsource(inspect.getmodule(function))
+    except (OSError, TypeError):
+        try:
+            source = inspect.getsource(function)
+        except (OSError, TypeError):
+            source = ''
+    h = hashlib.sha256(source.encode())
+    h.update(name.encode())
+    h.update(repr(version).encode())
+    _update_hash(h, results_dict)
+    return h.hexdigest()[:32]
+
+
+def grid_key(input_dict):
+    r"""
+    Hash of the input dimensions and their coordinates.
+    """
+    h = hashlib.sha256()
+    _update_hash(h, input_dict)
+    return h.hexdigest()[:32]
+
+
+def print_progress(done, total, start_time):
+    r"""
+    Default progress report, printed on one line.
+    """
+    elapsed = time.time() - start_time
+    remaining = elapsed * (total - done) / done if done else float('nan')
+    sys.stdout.write('\r{}/{} samples, {:.0f} s elapsed, {:.0f} s remaining'
+                     .format(done, total, elapsed, remaining))
+    if done == total:
+        sys.stdout.write('\n')
+    sys.stdout.flush()
+
+
+def evaluate_samples(samples, result_shape, function, processes=1,
+                     chunksize=None, progress=False, unpack=False):
+    r"""
+    Evaluate function for every row of samples, in chunks that are
+    distributed to a process pool.
+
+    Parameters
+    ----------
+    samples : np.array
+        One sample per row.
+
+    result_shape : list
+        Shape of the result of a single sample.
+
+    function, processes, chunksize, progress, unpack :
+        See generic_sampling.
+
+    Returns
+    -------
+    results : np.array
+        Results of shape (samples,) + result_shape, NaN where the
+        function returned None.
+    """
+    n_samples = len(samples)
+    results = np.full((n_samples,) + tuple(result_shape), np.nan)
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if chunksize is None:
+        chunksize = max(1, int(np.ceil(n_samples / (4 * processes))))
+    if progress is True:
+        progress = print_progress
+
+    chunks = [(start, min(start + chunksize, n_samples),
+               (function, samples[start:start + chunksize], result_shape, unpack))
+              for start in range(0, n_samples, chunksize)]
+
+    start_time = time.time()
+
+    def collect(finished):
+        done = 0
+        for start, stop, chunk_results in finished:
+            results[start:stop] = chunk_results
+            done += stop - start
+            if progress:
+                progress(done, n_samples, start_time)
+
+    if processes == 1:
+        collect(map(_evaluate_chunk_star, chunks))
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            collect(pool.imap_unordered(_evaluate_chunk_star, chunks))
+
+    return results
+
+
+def generic_sampling(input_dict, results_dict, function, processes=1,
+                     chunksize=None, progress=False, unpack=False):
+    r"""
+    n-dimensional full sampling, storing as xarray.
+
+    The Cartesian product of the input ranges is split into chunks that
+    are evaluated in a process pool. Results are written into a
+    preallocated array as the chunks finish.
+
+    Parameters
+    ----------
+    input_dict : OrderedDict
+        Ordered dictionary containing the ranges of the
+        dimensions.
+
+    results_dict : OrderedDict
+        Ordered dictionary containing the dimensions and
+        coordinates of the results of the function.
+
+    function : function
+        Function to be sampled. It has to be picklable (defined at module
+        level) if processes > 1.
+
+    processes : int
+        Number of worker processes. 1 evaluates in the calling process,
+        None uses all cores.
+
+    chunksize : int
+        Number of samples per chunk. Default is about four chunks per
+        process.
+
+    progress : bool or callable
+        If True, print progress. A callable is called as
+        progress(done, total, start_time) after every chunk.
+
+    unpack : bool
+        If True, call function(*sample) instead of function(sample).
+
+    Returns
+    -------
+    results : xarray.DataArray
+
+    sampling : np.array
+
+    indices : np.array
+    """
+    join_dicts = OrderedDict(list(input_dict.items()) + list(results_dict.items()))
+    dims = join_dicts.keys()
+    coords = join_dicts.values()
+    input_shape = [len(v) for v in input_dict.values()]
+    result_shape = [len(v) for v in results_dict.values()]
+    values = np.full(input_shape + result_shape, np.nan)
+
+    sampling = np.array(list(it.product(*input_dict.values())))
+    indices = np.array(list(it.product(*[np.arange(len(v)) for v in input_dict.values()])))
+
+    # input dimensions come first, so the flat sample number indexes the
+    # leading axis of this view in the order of it.product
+    flat_values = values.reshape((len(sampling),) + tuple(result_shape))
+    flat_values[...] = evaluate_samples(sampling, result_shape, function,
+                                        processes=processes, chunksize=chunksize,
+                                        progress=progress, unpack=unpack)
+
+    results = xr.DataArray(values, dims=dims, coords=coords)
+
+    return results, sampling, indices
+
+
+def grid_sampling(input_dict, results_dict, function):
+    r"""
+    n-dimensional full sampling of a vectorized function in one call,
+    storing as xarray.
+
+    The coordinates of every input dimension are reshaped to broadcast
+    against each other, so the full grid is evaluated without looping
+    over the samples.
+
+    Parameters
+    ----------
+    input_dict : OrderedDict
+        Ordered dictionary containing the ranges of the
+        dimensions.
+
+    results_dict : OrderedDict
+        Ordered dictionary containing the dimensions and
+        coordinates of the results of the function.
+
+    function : function
+        Vectorized function taking the inputs as keyword arguments and
+        returning the results in trailing axes, like
+        single_pipe_vectorized.
+
+    Returns
+    -------
+    results : xarray.DataArray
+    """
+    n_dims = len(input_dict)
+    args = {}
+    for i, (name, values) in enumerate(input_dict.items()):
+        shape = [1] * n_dims
+        shape[i] = -1
+        args[name] = np.reshape(values, shape)
+
+    join_dicts = OrderedDict(list(input_dict.items()) + list(results_dict.items()))
+    shape = [len(v) for v in join_dicts.values()]
+    values = np.broadcast_to(function(**args), shape)
+    results = xr.DataArray(np.array(values),
+                           dims=list(join_dicts.keys()),
+                           coords=list(join_dicts.values()))
+    return results
+
+
+def _open_store(store, mode='r'):
+    r"""
+    Open the arrays and metadata of a sampling store.
+    """
+    with open(os.path.join(store, 'meta.json')) as f:
+        meta = json.load(f)
+    values = np.load(os.path.join(store, 'results.npy'), mmap_mode=mode)
+    done = np.load(os.path.join(store, 'done.npy'), mmap_mode=mode)
+    return meta, values, done
+
+
+def open_sampling_store(store):
+    r"""
+    Open the results of streaming_sampling as xarray, backed by the
+    memory mapped file on disk. Samples that are not computed yet are NaN.
+
+    Parameters
+    ----------
+    store : str
+        Directory of the store.
+
+    Returns
+    -------
+    results : xarray.DataArray
+    """
+    meta, values, done = _open_store(store)
+    with xr.open_dataset(os.path.join(store, 'coords.nc')) as ds:
+        coords = [ds[dim].values for dim in meta['dims']]
+    return xr.DataArray(values, dims=meta['dims'], coords=coords)
+
+
+def streaming_sampling(input_dict, results_dict, function, store,
+                       chunksize=1000, processes=1, progress=False,
+                       unpack=False):
+    r"""
+    n-dimensional full sampling, streaming the results to disk.
+
+    Samples are generated chunk by chunk from their flat number, so the
+    Cartesian product is never built in memory. Results are written to a
+    memory mapped .npy file in the store directory as the chunks finish,
+    and every chunk is marked done after its results are flushed. Calling
+    the function again with the same store resumes an interrupted sweep
+    and only computes the missing chunks. A store written for other input
+    coordinates or another function (see grid_key and function_key) raises
+    a ValueError.
+
+    Parameters
+    ----------
+    input_dict : OrderedDict
+        Ordered dictionary containing the ranges of the
+        dimensions.
+
+    results_dict : OrderedDict
+        Ordered dictionary containing the dimensions and
+        coordinates of the results of the function.
+
+    function : function
+        Function to be sampled, see generic_sampling.
+
+    store : str
+        Directory to write the results to. It is created if it does not
+        exist.
+
+    chunksize : int
+        Number of samples per chunk, which is also the resume granularity.
+
+    processes, progress, unpack :
+        See generic_sampling.
+
+    Returns
+    -------
+    results : xarray.DataArray
+        Backed by the file on disk, see open_sampling_store.
+    """
+    join_dicts = OrderedDict(list(input_dict.items()) + list(results_dict.items()))
+    input_values = [np.asarray(v) for v in input_dict.values()]
+    input_shape = [len(v) for v in input_values]
+    result_shape = [len(v) for v in results_dict.values()]
+    n_samples = int(np.prod(input_shape))
+    n_chunks = int(np.ceil(n_samples / chunksize))
+    meta = {'dims': list(join_dicts.keys()),
+            'shape': input_shape + result_shape,
+            'chunksize': chunksize,
+            'grid_key': grid_key(input_dict),
+            'function_key': function_key(function, results_dict)}
+
+    if os.path.isfile(os.path.join(store, 'meta.json')):
+        stored_meta, values, done = _open_store(store, mode='r+')
+        if stored_meta != meta:
+            differ = [k for k in meta if stored_meta.get(k) != meta[k]]
+            raise ValueError('Store {} holds a different sampling, {} differ: {}'
+                             .format(store, ', '.join(differ), stored_meta))
+    else:
+        os.makedirs(store, exist_ok=True)
+        xr.Dataset(coords=join_dicts).to_netcdf(os.path.join(store, 'coords.nc'))
+        values = np.lib.format.open_memmap(os.path.join(store, 'results.npy'),
+                                           mode='w+', dtype=float,
+                                           shape=tuple(meta['shape']))
+        values[...] = np.nan
+        values.flush()
+        done = np.lib.format.open_memmap(os.path.join(store, 'done.npy'),
+                                         mode='w+', dtype=bool,
+                                         shape=(n_chunks,))
+        # meta.json is written last, it marks the store as complete
+        with open(os.path.join(store, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    flat_values = values.reshape((n_samples,) + tuple(result_shape))
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if progress is True:
+        progress = print_progress
+
+    chunk_args = (function, input_values, result_shape, unpack)
+    chunks = ((k * chunksize, min((k + 1) * chunksize, n_samples), chunk_args)
+              for k in np.flatnonzero(~done))
+
+    start_time = time.time()
+
+    def collect(finished):
+        n_done = int(min(done.sum() * chunksize, n_samples))
+        for start, stop, chunk_results in finished:
+            flat_values[start:stop] = chunk_results
+            values.flush()
+            done[start // chunksize] = True
+            done.flush()
+            n_done += stop - start
+            if progress:
+                progress(n_done, n_samples, start_time)
+
+    if processes == 1:
+        collect(map(_evaluate_lazy_chunk_star, chunks))
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            collect(pool.imap_unordered(_evaluate_lazy_chunk_star, chunks))
+
+    del flat_values, values, done
+
+    return open_sampling_store(store)
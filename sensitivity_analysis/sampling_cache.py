@@ -0,0 +1,141 @@
+import glob
+import os
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+
+from generic_sampling import evaluate_samples, function_key, grid_key
+
+
+def _save_entry(path, input_dict, values):
+    arrays = {'coord_{}'.format(i): np.asarray(v)
+              for i, v in enumerate(input_dict.values())}
+    tmp_path = path[:-len('.npz')] + '.tmp.npz'
+    np.savez(tmp_path, dims=np.array(list(input_dict.keys())), values=values,
+             **arrays)
+    os.replace(tmp_path, path)
+
+
+def evict(cache_dir, max_bytes, keep=()):
+    r"""
+    Delete the least recently used cache entries until the cache is
+    smaller than max_bytes. Entries in keep are not deleted.
+    """
+    entries = [(os.path.getmtime(p), os.path.getsize(p), p)
+               for p in glob.glob(os.path.join(cache_dir, '*', '*.npz'))]
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path in keep:
+            continue
+        os.remove(path)
+        total -= size
+
+
+def cached_sampling(input_dict, results_dict, function, cache_dir='sampling_cache',
+                    max_bytes=2**30, version=None, vectorized=False, **kwargs):
+    r"""
+    n-dimensional full sampling with a content-addressed result cache.
+
+    Results are stored per function key (module source, version and
+    result dimensions, see function_key) and grid key (input dimensions and
+    coordinates). A grid that was sampled before is loaded from the cache.
+    For a new grid, all points found in earlier grids of the same function
+    are copied and only the missing points are computed, e.g. when a
+    dimension is extended.
+
+    Parameters
+    ----------
+    input_dict : OrderedDict
+        Ordered dictionary containing the ranges of the
+        dimensions.
+
+    results_dict : OrderedDict
+        Ordered dictionary containing the dimensions and
+        coordinates of the results of the function.
+
+    function : function
+        Function to be sampled, see generic_sampling.
+
+    cache_dir : str
+        Directory of the cache.
+
+    max_bytes : int
+        Size limit of the cache. Least recently used entries are deleted
+        when it is exceeded.
+
+    version : hashable
+        Changing the version invalidates cached results of the function.
+
+    vectorized : bool
+        If True, the missing points are computed in one call
+        function(**inputs) with one array per input dimension, like
+        single_pipe_vectorized. Otherwise they are computed with
+        evaluate_samples.
+
+    **kwargs :
+        Passed to evaluate_samples, e.g. processes or progress.
+
+    Returns
+    -------
+    results : xarray.DataArray
+        With the number of computed points in attrs['n_computed'].
+    """
+    join_dicts = OrderedDict(list(input_dict.items()) + list(results_dict.items()))
+    input_values = [np.asarray(v) for v in input_dict.values()]
+    input_shape = [len(v) for v in input_values]
+    result_shape = [len(v) for v in results_dict.values()]
+
+    entry_dir = os.path.join(cache_dir, function_key(function, results_dict, version))
+    path = os.path.join(entry_dir, grid_key(input_dict) + '.npz')
+    os.makedirs(entry_dir, exist_ok=True)
+
+    values = np.full(input_shape + result_shape, np.nan)
+    known = np.zeros(input_shape, dtype=bool)
+
+    # the exact grid first, then earlier grids, most recently used first
+    entries = sorted(glob.glob(os.path.join(entry_dir, '*.npz')),
+                     key=lambda p: (p != path, -os.path.getmtime(p)))
+    for entry in entries:
+        if known.all():
+            break
+        with np.load(entry) as data:
+            if list(data['dims']) != [str(dim) for dim in input_dict.keys()]:
+                continue
+            # position of every coordinate in the cached grid, -1 if missing
+            positions = []
+            for i, v in enumerate(input_values):
+                cached = {c: j for j, c in enumerate(data['coord_{}'.format(i)].tolist())}
+                positions.append(np.array([cached.get(c, -1) for c in v.tolist()]))
+            if any((p < 0).all() for p in positions):
+                continue
+            new = np.ix_(*[np.flatnonzero(p >= 0) for p in positions])
+            old = np.ix_(*[p[p >= 0] for p in positions])
+            block, block_known = values[new], known[new]
+            block[~block_known] = data['values'][old][~block_known]
+            values[new] = block
+            known[new] = True
+        os.utime(entry)
+
+    missing = np.argwhere(~known)
+    if len(missing) > 0:
+        if vectorized:
+            args = {name: v[missing[:, i]]
+                    for i, (name, v) in enumerate(zip(input_dict.keys(), input_values))}
+            computed = function(**args)
+        else:
+            samples = np.column_stack([v[missing[:, i]]
+                                       for i, v in enumerate(input_values)])
+            computed = evaluate_samples(samples, result_shape, function, **kwargs)
+        values[tuple(missing.T)] = computed
+
+    if len(missing) > 0 or not os.path.isfile(path):
+        _save_entry(path, input_dict, values)
+    evict(cache_dir, max_bytes, keep=(path,))
+
+    results = xr.DataArray(values, dims=list(join_dicts.keys()),
+                           coords=list(join_dicts.values()))
+    results.attrs['n_computed'] = len(missing)
+    return results
@@ -0,0 +1,251 @@
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import pdist
+from scipy.stats import qmc
+
+from generic_sampling import evaluate_samples
+
+
+def _bounds(input_dict):
+    r"""
+    Lower and upper bound of every input and the mask of the inputs that
+    vary, taken from the ranges in input_dict.
+    """
+    lower = np.array([np.min(v) for v in input_dict.values()], dtype=float)
+    upper = np.array([np.max(v) for v in input_dict.values()], dtype=float)
+    return lower, upper, upper > lower
+
+
+def unit_design(n_samples, n_dims, design='sobol', seed=None):
+    r"""
+    Samples in the unit hypercube.
+
+    Parameters
+    ----------
+    n_samples : int
+        Number of samples. Sobol sequences are balanced for powers of two.
+    n_dims : int
+        Number of dimensions.
+    design : str
+        'lhs' (Latin hypercube), 'sobol', 'halton' or 'random'.
+    seed : int
+        Seed of the scrambling or random numbers.
+
+    Returns
+    -------
+    np.array
+        Array of shape (n_samples, n_dims) with values in [0, 1).
+    """
+    if design == 'lhs':
+        sampler = qmc.LatinHypercube(d=n_dims, seed=seed)
+    elif design == 'sobol':
+        sampler = qmc.Sobol(d=n_dims, seed=seed)
+    elif design == 'halton':
+        sampler = qmc.Halton(d=n_dims, seed=seed)
+    elif design == 'random':
+        return np.random.RandomState(seed).random_sample((n_samples, n_dims))
+    else:
+        raise ValueError("Unknown design '{}'.".format(design))
+    return sampler.random(n_samples)
+
+
+def coverage(unit_samples, max_pairs=5000):
+    r"""
+    Coverage statistics of samples in the unit hypercube.
+
+    Returns
+    -------
+    dict
+        'n_samples',
+        'discrepancy': centered L2 discrepancy, lower is more uniform,
+        'min_distance': smallest distance between two samples,
+        'strata_filled': smallest fraction, over all dimensions, of n
+        equal one-dimensional strata that contain a sample (1 for a Latin
+        hypercube).
+        The distance is computed on at most max_pairs samples.
+    """
+    n, d = unit_samples.shape
+    subset = unit_samples[:max_pairs]
+    strata = np.minimum((unit_samples * n).astype(int), n - 1)
+    filled = [len(np.unique(strata[:, i])) / n for i in range(d)]
+    return {'n_samples': n,
+            'discrepancy': float(qmc.discrepancy(unit_samples)) if n > 1 else np.nan,
+            'min_distance': float(pdist(subset).min()) if len(subset) > 1 else np.nan,
+            'strata_filled': float(min(filled)) if d else np.nan}
+
+
+def _to_inputs(unit_samples, lower, upper, varies):
+    r"""
+    Scale unit samples of the varying inputs to the input ranges, constant
+    inputs keep their value.
+    """
+    samples = np.tile(lower, (len(unit_samples), 1))
+    samples[:, varies] = lower[varies] + unit_samples * (upper - lower)[varies]
+    return samples
+
+
+def _to_xarray(samples, values, input_dict, results_dict):
+    r"""
+    Results along a 'sample' dimension, with the inputs as coordinates.
+    """
+    coords = OrderedDict([('sample', np.arange(len(samples)))])
+    for i, name in enumerate(input_dict.keys()):
+        coords[name] = ('sample', samples[:, i])
+    coords.update(results_dict)
+    return xr.DataArray(values, dims=['sample'] + list(results_dict.keys()),
+                        coords=coords)
+
+
+def design_sampling(input_dict, results_dict, function, n_samples,
+                    design='sobol', seed=None, **kwargs):
+    r"""
+    Sampling with a space-filling design instead of the full grid.
+
+    Every input varies continuously between the minimum and maximum of its
+    range in input_dict, inputs with a single value are kept constant.
+
+    Parameters
+    ----------
+    input_dict : OrderedDict
+        Ordered dictionary containing the ranges of the
+        dimensions.
+
+    results_dict : OrderedDict
+        Ordered dictionary containing the dimensions and
+        coordinates of the results of the function.
+
+    function : function
+        Function to be sampled, see generic_sampling.
+
+    n_samples : int
+        Number of samples.
+
+    design : str
+        See unit_design.
+
+    seed : int
+        See unit_design.
+
+    **kwargs :
+        Passed to evaluate_samples, e.g. processes or unpack.
+
+    Returns
+    -------
+    results : xarray.DataArray
+        Results along the dimension 'sample', with the inputs as
+        coordinates along it.
+
+    sampling : np.array
+
+    coverage : dict
+        See coverage.
+    """
+    lower, upper, varies = _bounds(input_dict)
+    unit_samples = unit_design(n_samples, varies.sum(), design=design, seed=seed)
+    sampling = _to_inputs(unit_samples, lower, upper, varies)
+    result_shape = [len(v) for v in results_dict.values()]
+    values = evaluate_samples(sampling, result_shape, function, **kwargs)
+    results = _to_xarray(sampling, values, input_dict, results_dict)
+    return results, sampling, coverage(unit_samples)
+
+
+def adaptive_sampling(input_dict, results_dict, function, n_initial, n_max,
+                      batch_size=None, n_neighbors=None, n_candidates=20,
+                      seed=None, **kwargs):
+    r"""
+    Adaptive sampling that concentrates samples where the outputs change
+    quickly.
+
+    Starts with a Sobol design of n_initial samples. In every refinement
+    step, candidates from a Sobol sequence are scored by the variation of
+    the normalized outputs among the nearest samples times the distance to
+    the nearest sample, so that both steep regions and gaps are refined.
+    The batch_size best candidates are evaluated, until n_max samples are
+    reached.
+
+    Parameters
+    ----------
+    input_dict, results_dict, function :
+        See design_sampling.
+
+    n_initial : int
+        Number of samples of the initial design.
+
+    n_max : int
+        Total number of samples.
+
+    batch_size : int
+        Number of samples added per refinement step, default n_initial.
+
+    n_neighbors : int
+        Number of nearest samples to estimate the local variation, default
+        twice the number of varying inputs.
+
+    n_candidates : int
+        Number of candidates per added sample.
+
+    seed : int
+        Seed of the Sobol scrambling.
+
+    **kwargs :
+        Passed to evaluate_samples, e.g. processes or unpack.
+
+    Returns
+    -------
+    results : xarray.DataArray
+
+    sampling : np.array
+
+    coverage : dict
+        See coverage, with the number of refinement steps in 'n_steps'.
+    """
+    lower, upper, varies = _bounds(input_dict)
+    n_dims = varies.sum()
+    result_shape = [len(v) for v in results_dict.values()]
+    if batch_size is None:
+        batch_size = n_initial
+    if n_neighbors is None:
+        n_neighbors = 2 * n_dims
+
+    def evaluate(unit_samples):
+        samples = _to_inputs(unit_samples, lower, upper, varies)
+        values = evaluate_samples(samples, result_shape, function, **kwargs)
+        return values.reshape(len(samples), -1)
+
+    candidates = qmc.Sobol(d=n_dims, seed=seed)
+    unit_samples = candidates.random(n_initial)
+    values = evaluate(unit_samples)
+    n_steps = 0
+
+    while len(unit_samples) < n_max:
+        n_new = min(batch_size, n_max - len(unit_samples))
+
+        # normalize every output, so that all contribute to the variation
+        scale = np.nanstd(values, axis=0)
+        scale[~(scale > 0)] = 1
+        normalized = values / scale
+
+        tree = cKDTree(unit_samples)
+        k = min(n_neighbors, len(unit_samples))
+        pool = candidates.random(n_candidates * n_new)
+        distance, neighbors = tree.query(pool, k=k)
+        distance = distance.reshape(len(pool), k)
+        neighbors = neighbors.reshape(len(pool), k)
+        local = normalized[neighbors]
+        variation = np.nan_to_num(np.nanmean(np.nanstd(local, axis=1), axis=1))
+        score = (variation + 1e-12) * distance[:, 0]
+
+        new = pool[np.argsort(score)[::-1][:n_new]]
+        unit_samples = np.vstack([unit_samples, new])
+        values = np.vstack([values, evaluate(new)])
+        n_steps += 1
+
+    sampling = _to_inputs(unit_samples, lower, upper, varies)
+    results = _to_xarray(sampling, values.reshape([len(sampling)] + result_shape),
+                         input_dict, results_dict)
+    stats = coverage(unit_samples)
+    stats['n_steps'] = n_steps
+    return results, sampling, stats
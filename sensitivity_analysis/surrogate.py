@@ -0,0 +1,262 @@
+import itertools as it
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+
+def _numeric_dims(results):
+    return [dim for dim in results.dims
+            if dim in results.coords and results[dim].dtype.kind in 'biuf']
+
+
+class _Surrogate(object):
+    r"""
+    Evaluation by name for the surrogates, which set input_dims, fixed
+    and output_shape and implement predict.
+    """
+    def __call__(self, *args, **kwargs):
+        r"""
+        Evaluate at broadcast arrays given in the order of input_dims or
+        by name. All input_dims are required. Inputs that are constant in
+        the results (attribute fixed) may only be given with that value.
+        """
+        names = self.input_dims[len(args):]
+        missing = [dim for dim in names if dim not in kwargs]
+        if missing:
+            raise TypeError('Missing input dimensions {}, the surrogate takes {}.'
+                            .format(missing, self.input_dims))
+        for dim, value in kwargs.items():
+            if dim in names:
+                continue
+            if dim not in self.fixed:
+                raise TypeError("'{}' is not an input dimension of the surrogate, "
+                                "it takes {}.".format(dim, self.input_dims))
+            if not np.all(np.asarray(value) == self.fixed[dim]):
+                raise ValueError("'{}' is fixed to {} in the sampled results."
+                                 .format(dim, self.fixed[dim]))
+        args = list(args) + [kwargs[dim] for dim in names]
+        args = np.broadcast_arrays(*args)
+        points = np.stack([np.ravel(a) for a in args], axis=-1)
+        return self.predict(points).reshape(args[0].shape + self.output_shape)
+
+
+class GridSurrogate(_Surrogate):
+    r"""
+    Multilinear interpolation of the results of generic_sampling.
+
+    Input dimensions with a single coordinate are dropped, all other
+    dimensions are outputs.
+
+    Parameters
+    ----------
+    results : xarray.DataArray
+        Results on a full grid.
+
+    input_dims : list
+        Dimensions to interpolate in, default all dimensions with numeric
+        coordinates.
+
+    Attributes
+    ----------
+    input_dims : list
+        Dimensions in the order of the query points.
+
+    fixed : dict
+        Dropped input dimensions and their single coordinate.
+
+    output_dims : list
+
+    cv_error : dict
+        Cross-validated error per output, see cross_validate.
+    """
+    def __init__(self, results, input_dims=None):
+        if input_dims is None:
+            input_dims = _numeric_dims(results)
+        self.fixed = {dim: results[dim].values[0] for dim in input_dims
+                      if len(results[dim]) == 1}
+        self.input_dims = [dim for dim in input_dims if dim not in self.fixed]
+        self.output_dims = [dim for dim in results.dims if dim not in input_dims]
+
+        results = results.isel({dim: 0 for dim in self.fixed})
+        results = results.sortby(self.input_dims)
+        results = results.transpose(*(self.input_dims + self.output_dims))
+        self.output_coords = {dim: results[dim].values for dim in self.output_dims}
+        self.output_shape = tuple(results.shape[len(self.input_dims):])
+
+        self.grid = [results[dim].values.astype(float) for dim in self.input_dims]
+        self.values = results.values
+        self._interpolator = RegularGridInterpolator(
+            self.grid, self.values, bounds_error=False, fill_value=np.nan)
+        self.cv_error = self.cross_validate()
+
+    def predict(self, points):
+        r"""
+        Interpolate at points of shape (n, len(input_dims)), returns
+        an array of shape (n,) + output_shape. Points outside the grid are
+        NaN.
+        """
+        return self._interpolator(np.atleast_2d(points))
+
+    def cross_validate(self):
+        r"""
+        Error of interpolating every second interior grid plane from its
+        neighbours, one input dimension at a time. This is the error of
+        the grid at half the resolution, an upper estimate of its own
+        error.
+
+        Returns
+        -------
+        dict
+            'rmse' and 'max_abs' with the shape of the outputs, 'n' the
+            number of held out points.
+        """
+        errors = []
+        for axis, coords in enumerate(self.grid):
+            if len(coords) < 3:
+                continue
+            held_out = np.arange(1, len(coords) - 1, 2)
+            kept = np.setdiff1d(np.arange(len(coords)), held_out)
+            grid = list(self.grid)
+            grid[axis] = coords[kept]
+            interpolator = RegularGridInterpolator(
+                grid, np.take(self.values, kept, axis=axis))
+            truth = np.take(self.values, held_out, axis=axis)
+            grid[axis] = coords[held_out]
+            points = np.stack([g.ravel() for g in np.meshgrid(*grid, indexing='ij')],
+                              axis=-1)
+            errors.append(interpolator(points)
+                          - truth.reshape((len(points),) + self.output_shape))
+        return _error_stats(errors, self.output_shape)
+
+
+def _error_stats(errors, output_shape):
+    if not errors:
+        nan = np.full(output_shape, np.nan)
+        return {'rmse': nan, 'max_abs': nan, 'n': 0}
+    errors = np.concatenate(errors)
+    return {'rmse': np.sqrt(np.nanmean(errors**2, axis=0)),
+            'max_abs': np.nanmax(np.abs(errors), axis=0),
+            'n': len(errors)}
+
+
+def polynomial_features(x, degree):
+    r"""
+    All monomials of the columns of x up to degree, including the
+    constant.
+    """
+    columns = [np.ones(len(x))]
+    for d in range(1, degree + 1):
+        for combination in it.combinations_with_replacement(range(x.shape[1]), d):
+            columns.append(np.prod(x[:, combination], axis=1))
+    return np.column_stack(columns)
+
+
+class RegressionSurrogate(_Surrogate):
+    r"""
+    Polynomial least squares regression of scattered results, e.g. from
+    design_sampling.
+
+    Samples with NaN in any output are left out of the fit.
+
+    Parameters
+    ----------
+    results : xarray.DataArray
+        Results along sample_dim, with the inputs as coordinates along it.
+
+    input_dims : list
+        Input coordinates, default all numeric coordinates along
+        sample_dim that vary.
+
+    degree : int
+        Degree of the polynomial.
+
+    ridge : float
+        Ridge regularization of the coefficients.
+
+    n_folds : int
+        Number of folds of the cross validation.
+
+    sample_dim : str
+
+    seed : int
+        Seed of the random assignment of the samples to the folds.
+
+    Attributes
+    ----------
+    input_dims, output_dims, fixed, cv_error :
+        See GridSurrogate. fixed are the numeric inputs that are constant
+        over the samples.
+    """
+    def __init__(self, results, input_dims=None, degree=3, ridge=1e-8,
+                 n_folds=5, sample_dim='sample', seed=None):
+        if input_dims is None:
+            input_dims = [name for name, coord in results.coords.items()
+                          if coord.dims == (sample_dim,) and name != sample_dim
+                          and coord.dtype.kind in 'biuf'
+                          and np.ptp(coord.values) > 0]
+        self.input_dims = input_dims
+        self.fixed = {name: coord.values[0] for name, coord in results.coords.items()
+                      if coord.dims == (sample_dim,) and name not in input_dims
+                      and coord.dtype.kind in 'biuf' and np.ptp(coord.values) == 0}
+        self.output_dims = [dim for dim in results.dims if dim != sample_dim]
+        results = results.transpose(*([sample_dim] + self.output_dims))
+        self.output_coords = {dim: results[dim].values for dim in self.output_dims}
+        self.output_shape = tuple(results.shape[1:])
+        self.degree = degree
+        self.ridge = ridge
+
+        x = np.column_stack([results[dim].values.astype(float) for dim in input_dims])
+        y = results.values.reshape(len(x), -1)
+        valid = ~np.isnan(y).any(axis=1)
+        x, y = x[valid], y[valid]
+
+        self.lower = x.min(axis=0)
+        self.scale = np.where(np.ptp(x, axis=0) > 0, np.ptp(x, axis=0), 1)
+        self.coefficients = self._fit(x, y)
+
+        folds = np.random.RandomState(seed).permutation(len(x)) % n_folds
+        errors = []
+        for fold in range(n_folds):
+            test = folds == fold
+            if test.all() or not test.any():
+                continue
+            coefficients = self._fit(x[~test], y[~test])
+            errors.append((self._features(x[test]) @ coefficients - y[test])
+                          .reshape((test.sum(),) + self.output_shape))
+        self.cv_error = _error_stats(errors, self.output_shape)
+
+    def _features(self, x):
+        return polynomial_features((x - self.lower) / self.scale, self.degree)
+
+    def _fit(self, x, y):
+        a = self._features(x)
+        lhs = a.T @ a + self.ridge * len(x) * np.eye(a.shape[1])
+        return np.linalg.solve(lhs, a.T @ y)
+
+    def predict(self, points):
+        r"""
+        Evaluate at points of shape (n, len(input_dims)), returns an array
+        of shape (n,) + output_shape.
+        """
+        points = np.atleast_2d(points)
+        return (self._features(points) @ self.coefficients).reshape(
+            (len(points),) + self.output_shape)
+
+
+def build_surrogate(results, input_dims=None, sample_dim='sample', **kwargs):
+    r"""
+    Surrogate of sampled results: a RegressionSurrogate if the results
+    have sample_dim, a GridSurrogate otherwise.
+
+    Examples
+    --------
+    >>> surrogate = build_surrogate(sam_results)
+    >>> surrogate.cv_error['rmse']
+    >>> surrogate.input_dims
+    ['Q_cons', 'DT_prod_in', 'k', 'D']
+    >>> surrogate(Q_cons=q, DT_prod_in=90, k=1.5, D=0.3)
+    """
+    if sample_dim in results.dims:
+        return RegressionSurrogate(results, input_dims=input_dims,
+                                   sample_dim=sample_dim, **kwargs)
+    return GridSurrogate(results, input_dims=input_dims, **kwargs)